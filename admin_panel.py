@@ -4,7 +4,6 @@ Admin Panel for English Learning Telegram Bot
 A web-based admin interface for managing users, content, and viewing analytics
 """
 
-import sqlite3
 import os
 from datetime import datetime, timedelta
 from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
@@ -12,6 +11,7 @@ import json
 import plotly.graph_objs as go
 import plotly.utils
 from collections import defaultdict
+from db_connection import get_manager
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'  # Change this in production
@@ -24,9 +24,9 @@ class AdminDatabase:
         self.content_db_path = "content_data.db"
     
     def get_connection(self, db_type='user'):
-        """Get database connection."""
+        """Borrow a read-only pooled connection; close() returns it to the pool."""
         db_path = self.user_db_path if db_type == 'user' else self.content_db_path
-        return sqlite3.connect(db_path)
+        return get_manager(db_path).acquire_read()
     
     def get_user_stats(self):
         """Get comprehensive user statistics."""
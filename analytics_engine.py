@@ -4,7 +4,6 @@ Advanced Analytics Engine for English Learning Telegram Bot
 Comprehensive analytics and metrics for research and thesis purposes
 """
 
-import sqlite3
 import json
 import pandas as pd
 import numpy as np
@@ -13,6 +12,7 @@ from collections import defaultdict, Counter
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy import stats
+from db_connection import get_manager
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -27,9 +27,9 @@ class AdvancedAnalytics:
         plt.rcParams['font.family'] = ['Arial Unicode MS', 'Tahoma', 'DejaVu Sans']
         
     def get_connection(self, db_type='user'):
-        """Get database connection."""
+        """Borrow a read-only pooled connection; close() returns it to the pool."""
         db_path = self.user_db_path if db_type == 'user' else self.content_db_path
-        return sqlite3.connect(db_path)
+        return get_manager(db_path, profile='analytics').acquire_read()
     
     def get_comprehensive_user_stats(self):
         """Get comprehensive user statistics for research analysis."""
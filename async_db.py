@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Awaitable reads for the bot's handlers
+UserDatabase and ContentManager are synchronous, so a slow query in a handler
+stalls the event loop for every other user. AsyncDatabase runs the handlers'
+profile, progress and content lookups on a few worker threads, each with its
+own read-only connection from the shared pool. Writes still go through the
+synchronous UserDatabase on the loop thread, and reads overlay its write
+buffer, so a handler sees its own updates.
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db_connection import get_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Run read-only UserDatabase/ContentManager calls off the event loop."""
+
+    def __init__(self, db, content_manager, user_db_path="user_data.db", workers=4,
+                 max_pending=256, slow_call_ms=200):
+        """Create the worker pool.
+
+        At most max_pending calls are queued or running at once; further
+        callers wait for a slot instead of piling work onto the executor.
+        Calls slower than slow_call_ms, queueing included, are logged.
+        """
+        self.db = db
+        self.content_manager = content_manager
+        self.manager = get_manager(user_db_path)
+        self.slow_call_ms = slow_call_ms
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-read")
+        self._slots = asyncio.Semaphore(max_pending)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _views(self):
+        """The calling worker thread's (user, content) read views, created on first use."""
+        local = self._local
+        if not hasattr(local, 'user'):
+            conn = self.manager.acquire_read()
+            with self._lock:
+                self._connections.append(conn)
+            local.user = self.db.read_view(conn)
+            local.content = self.content_manager.read_view(conn)
+        return local.user, local.content
+
+    def _call(self, fn, args, queued_at):
+        wait_ms = (time.perf_counter() - queued_at) * 1000
+        user, content = self._views()
+        return fn(user, content, *args), wait_ms
+
+    async def run(self, name, fn, *args):
+        """Await fn(user_view, content_view, *args) on a worker thread."""
+        started = time.perf_counter()
+        wait_ms = 0.0
+        failed = False
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            try:
+                result, wait_ms = await loop.run_in_executor(
+                    self._executor, self._call, fn, args, time.perf_counter()
+                )
+                return result
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self._record(name, (time.perf_counter() - started) * 1000, wait_ms, failed)
+
+    def _record(self, name, elapsed_ms, wait_ms, failed):
+        stats = self._stats.setdefault(name, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                              'wait_ms': 0.0})
+        stats['calls'] += 1
+        stats['errors'] += failed
+        stats['total_ms'] += elapsed_ms
+        stats['wait_ms'] += wait_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        if elapsed_ms >= self.slow_call_ms:
+            logger.warning(f"Slow database read {name}: {elapsed_ms:.0f}ms ({wait_ms:.0f}ms queued)")
+
+    def stats(self):
+        """Return per-call counts and average/max latency in ms."""
+        return {
+            name: {
+                'calls': s['calls'],
+                'errors': s['errors'],
+                'avg_ms': round(s['total_ms'] / s['calls'], 1) if s['calls'] else 0,
+                'avg_wait_ms': round(s['wait_ms'] / s['calls'], 1) if s['calls'] else 0,
+                'max_ms': round(s['max_ms'], 1)
+            }
+            for name, s in self._stats.items()
+        }
+
+    def close(self):
+        """Stop the workers and give their connections back to the pool."""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    # --- user database ------------------------------------------------------
+
+    async def get_profile(self, user_id):
+        """Load a UserProfile; its write methods go through the main UserDatabase."""
+        profile = await self.run('get_profile', lambda user, content: user.get_profile(user_id))
+        profile.db = self.db
+        return profile
+
+    async def get_user_progress(self, user_id):
+        return await self.run('get_user_progress', lambda user, content: user.get_user_progress(user_id))
+
+    async def get_section_progress(self, user_id, section, level):
+        return await self.run(
+            'get_section_progress', lambda user, content: user.get_section_progress(user_id, section, level)
+        )
+
+    async def get_words_studied_count(self, user_id):
+        return await self.run(
+            'get_words_studied_count', lambda user, content: user.get_words_studied_count(user_id)
+        )
+
+    async def has_recent_assessment(self, user_id, hours=24):
+        return await self.run(
+            'has_recent_assessment', lambda user, content: user.has_recent_assessment(user_id, hours)
+        )
+
+    async def get_latest_assessment_result(self, user_id):
+        return await self.run(
+            'get_latest_assessment_result', lambda user, content: user.get_latest_assessment_result(user_id)
+        )
+
+    # --- content --------------------------------------------------------------
+
+    async def build_vocab_test(self, user_id, level, count=20):
+        return await self.run(
+            'build_vocab_test', lambda user, content: content.build_vocab_test(user_id, level, count)
+        )
+
+    async def get_grammar_lesson_for_level(self, user_id, level):
+        return await self.run(
+            'get_grammar_lesson_for_level',
+            lambda user, content: content.get_grammar_lesson_for_level(user_id, level)
+        )
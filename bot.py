@@ -9,17 +9,36 @@ logger = logging.getLogger(__name__)
 
 import os
 import re
+import asyncio
+import secrets
+import contextlib
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, Message
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-from openai import OpenAI
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler, TypeHandler
 import pytz
 from datetime import time, datetime
 import json
 
 # Import our custom modules
-from user_db import UserDatabase
+from user_db import UserDatabase, UserProfile
+from write_buffer import WriteBuffer
+from async_db import AsyncDatabase
+from db_writer import DBWriter
+from broadcast import Broadcaster
+import db_connection
 from content_manager import ContentManager
+from llm_client import LLMClient
+from update_processor import PerUserUpdateProcessor
+from streaming_reply import StreamingReply
+from response_cache import GradingCache
+from intent_router import IntentRouter, MENU_HINT
+from circuit_breaker import CircuitOpenError
+from grading import grade, format_feedback, GradingFormatError
+from prompt_budget import render_with_budget, summarize_grammar_rule
+from state_store import create_state_store, UserStates, SessionSync
+from pre_grader import (contains_word_form, pre_grade_vocabulary, pre_grade_grammar,
+                        fallback_grade_vocabulary, fallback_grade_grammar,
+                        fallback_grade_conversation, fallback_teacher_reply)
 
 # Validation function for user inputs
 def validate_user_input(text: str, context_word: str = None) -> tuple[bool, str]:
@@ -55,8 +74,8 @@ def validate_user_input(text: str, context_word: str = None) -> tuple[bool, str]
     if len(words) > 1 and valid_words / len(words) < 0.5:
         return False, "لطفاً کلمات انگلیسی معنی‌دار استفاده کنید."
     
-    # Check for context word if provided (for vocabulary)
-    if context_word and context_word.lower() not in text.lower():
+    # Check for context word if provided (for vocabulary), accepting inflected forms
+    if context_word and not contains_word_form(text, context_word):
         return False, f"لطفاً از کلمه '{context_word}' در جمله خود استفاده کنید."
     
     return True, ""
@@ -74,7 +93,15 @@ if not OPENAI_API_KEY:
     logger.error("Error: OPENAI_API_KEY not found in .env file.")
     exit()
 try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    llm_client = LLMClient(
+        api_key=OPENAI_API_KEY,
+        max_concurrent_requests=int(os.getenv('OPENAI_MAX_CONCURRENCY', '200')),
+        breaker_options={
+            'error_rate_threshold': float(os.getenv('LLM_BREAKER_ERROR_RATE', '0.5')),
+            'slow_call_ms': int(os.getenv('LLM_BREAKER_SLOW_MS', '10000')),
+            'open_seconds': int(os.getenv('LLM_BREAKER_OPEN_SECONDS', '30'))
+        }
+    )
     # Use logger now that it's defined
     logger.info("OpenAI API configured successfully")
 except Exception as e:
@@ -82,13 +109,63 @@ except Exception as e:
     logger.error(f"Error configuring OpenAI API: {e}", exc_info=True)
     exit()
 
-# Initialize database and content manager
-db = UserDatabase()
+# Stream LLM feedback into progressively edited messages (set LLM_STREAMING=0 to disable)
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') == '1'
+
+# Pause between a vocabulary test answer's feedback and the next question
+VOCAB_TEST_PACING_SECONDS = float(os.getenv('VOCAB_TEST_PACING_SECONDS', '2'))
+
+# Initialize database and content manager. last_active and practice progress
+# are written behind in batches; set DB_WRITE_BUFFER=0 to write immediately.
+write_buffer = None
+if os.getenv('DB_WRITE_BUFFER', '1') == '1':
+    write_buffer = WriteBuffer(
+        flush_interval=float(os.getenv('DB_FLUSH_INTERVAL', '5')),
+        max_pending=int(os.getenv('DB_FLUSH_MAX_PENDING', '500'))
+    )
+db = UserDatabase(write_buffer=write_buffer)
 content_manager = ContentManager()
+# Studied words, test results, lesson completions and seen topics are applied
+# by one writer task that commits everything arriving within a few ms together
+db_writer = DBWriter(
+    db.conn,
+    max_batch=int(os.getenv('DB_WRITER_MAX_BATCH', '100')),
+    max_delay_ms=float(os.getenv('DB_WRITER_MAX_DELAY_MS', '5'))
+)
+content_manager.writer = db_writer
+# Handlers await profile, progress and content reads on worker threads with
+# their own read-only connections instead of blocking the event loop
+async_db = AsyncDatabase(
+    db, content_manager,
+    workers=int(os.getenv('DB_READ_WORKERS', '4')),
+    max_pending=int(os.getenv('DB_READ_MAX_PENDING', '256')),
+    slow_call_ms=int(os.getenv('DB_READ_SLOW_MS', '200'))
+)
+
+# Exact-match cache for grading responses. Bump a version whenever its prompt
+# changes so stale feedback is not served for the new rubric.
+VOCAB_PROMPT_VERSION = "vocab-v2"
+GRAMMAR_PROMPT_VERSION = "grammar-v3"
+intent_router = IntentRouter()
+grading_cache = GradingCache(
+    db_path=os.getenv('GRADING_CACHE_PATH', 'grading_cache.db'),
+    ttl_seconds=int(os.getenv('GRADING_CACHE_TTL_DAYS', '30')) * 24 * 3600,
+    max_entries=int(os.getenv('GRADING_CACHE_MAX_ENTRIES', '50000'))
+)
 
 # Define conversation states
 MAIN_MENU, LEVEL_ASSESSMENT, VOCABULARY_PRACTICE, GRAMMAR_LESSON, CONVERSATION_PRACTICE, VOCABULARY_TEST = range(6)
-user_states = {}
+
+# Conversation state and session data (context.user_data) live in a shared
+# store so sessions survive restarts and several bot processes can serve users.
+# STATE_STORE=memory keeps them in this process only.
+state_store = create_state_store(
+    backend=os.getenv('STATE_STORE', 'sqlite'),
+    db_path=os.getenv('STATE_STORE_PATH', 'session_state.db'),
+    ttl_seconds=int(os.getenv('SESSION_TTL_HOURS', '24')) * 3600
+)
+user_states = UserStates(state_store)
+session_sync = SessionSync(state_store)
 
 # Persian names for levels (update everywhere used)
 levels_persian = {
@@ -98,20 +175,41 @@ levels_persian = {
     "advanced": "پیشرفته"
 }
 
+def user_lock(application: Application, user_id):
+    """The per-user lock updates are processed under, for jobs that touch user state.
+
+    main() always installs PerUserUpdateProcessor, sequential mode included;
+    the no-op fallback only covers applications built without it.
+    """
+    processor = application.update_processor
+    if isinstance(processor, PerUserUpdateProcessor):
+        return processor.user_lock(user_id)
+    return contextlib.nullcontext()
+
+async def get_profile(context: ContextTypes.DEFAULT_TYPE, user_id) -> UserProfile:
+    """Return the UserProfile for this update, loading it with one query on first use."""
+    profile = getattr(context, 'user_profile', None)
+    if profile is None or profile.user_id != user_id:
+        # The context object is shared by every handler that runs for one update
+        profile = await async_db.get_profile(user_id)
+        context.user_profile = profile
+    return profile
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a welcome message when the command /start is issued."""
     user_id = update.effective_chat.id
     username = update.effective_user.username or str(user_id)
     
     # Register user in database
-    is_new = db.register_user(user_id, username)
-    db.update_last_active(user_id)
+    profile = await get_profile(context, user_id)
+    is_new = profile.register(username)
+    profile.touch()
     
     # Set user state
     user_states[user_id] = MAIN_MENU
     
     # Check if user has completed assessment (store in context or db)
-    assessment_done = db.is_assessment_done(user_id)
+    assessment_done = profile.assessment_done
     if not assessment_done:
         keyboard = [[KeyboardButton("🧪 شروع سنجش سطح")]]
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
@@ -136,7 +234,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a help message when the command /help is issued."""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    (await get_profile(context, user_id)).touch()
     
     help_text = """
 راهنمای ربات یادگیری زبان انگلیسی:
@@ -165,11 +263,12 @@ async def assess_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
     username = update.effective_user.username or str(user_id)
     
     # Ensure user exists in database before assessment
-    was_new = db.register_user(user_id, username)
+    profile = await get_profile(context, user_id)
+    was_new = profile.register(username)
     if was_new:
         logger.info(f"New user {user_id} registered during assessment start")
     
-    db.update_last_active(user_id)
+    profile.touch()
     logger.info(f"Starting level assessment for user {user_id}")
 
     user_states[user_id] = LEVEL_ASSESSMENT
@@ -260,65 +359,21 @@ async def send_assessment_question(message: Message, context: ContextTypes.DEFAU
         # --- End Add Logging ---
 
         try:
-            # Get current level before update
-            current_level = db.get_user_level(user_id)
-            logger.info(f"User {user_id} current level before update: '{current_level}'")
-            
-            # Update user level in database - now returns boolean success indicator
-            success = db.update_user_level(user_id, level)
+            profile = await get_profile(context, user_id)
+            logger.info(f"User {user_id} current level before update: '{profile.level}'")
             
-            if not success:
-                logger.warning(f"DB update_user_level returned failure for user {user_id}. Trying direct SQL update...")
-                
-                # First try the force_update_level method
-                force_success = db.force_update_level(user_id, level)
-                
-                if not force_success:
-                    logger.error(f"Even force_update_level failed for user {user_id}. Trying raw SQL as final resort...")
-                    
-                    # Try direct update as a absolute last resort
-                    try:
-                        import sqlite3
-                        conn = sqlite3.connect("user_data.db")
-                        cursor = conn.cursor()
-                        
-                        # First check if user exists
-                        cursor.execute("SELECT COUNT(*) FROM users WHERE user_id = ?", (user_id,))
-                        exists = cursor.fetchone()[0] > 0
-                        
-                        if not exists:
-                            # Create user if doesn't exist
-                            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            cursor.execute(
-                                "INSERT INTO users (user_id, username, level, join_date, last_active) VALUES (?, ?, ?, ?, ?)",
-                                (user_id, f"user_{user_id}", level, now, now)
-                            )
-                            logger.info(f"Direct SQL: Created new user {user_id} with level '{level}'")
-                        else:
-                            # Update existing user
-                            cursor.execute("UPDATE users SET level = ? WHERE user_id = ?", (level, user_id))
-                            logger.info(f"Direct SQL: Updated existing user {user_id} to level '{level}'")
-                        
-                        conn.commit()
-                        
-                        # Verify direct update
-                        cursor.execute("SELECT level FROM users WHERE user_id = ?", (user_id,))
-                        direct_result = cursor.fetchone()
-                        logger.info(f"Direct SQL: After update, level for user {user_id} is: '{direct_result[0] if direct_result else 'unknown'}'")
-                        conn.close()
-                    except Exception as direct_e:
-                        logger.error(f"ALL UPDATE METHODS FAILED! Final error: {direct_e}")
-            
-            # Double-check that level was updated by reading it back
-            updated_level = db.get_user_level(user_id)
-            logger.info(f"Final check: User {user_id} level after all update attempts: '{updated_level}'")
+            # Write-through update; falls back to force_update_level if the plain update fails
+            if profile.set_level(level):
+                logger.info(f"User {user_id} level updated to '{profile.level}'")
+            else:
+                logger.error(f"Could not update level for user {user_id} to '{level}'")
             
             # Save overall progress - make extra sure this succeeds
             progress_success = False
             try:
                 # Use the specialized save method for assessment results
                 logger.info(f"Saving assessment progress for user {user_id}, score: {percentage}%")
-                progress_success, error = db.save_assessment_result(user_id, percentage)
+                progress_success, error = await db_writer.write(db.save_assessment_result, user_id, percentage)
                 
                 if not progress_success:
                     logger.error(f"Failed to save assessment result: {error}")
@@ -366,7 +421,7 @@ async def send_assessment_question(message: Message, context: ContextTypes.DEFAU
                 text=(
                     f"🎉 **ارزیابی سطح شما به پایان رسید!**\n\n"
                     f"📊 **نتیجه شما:** {correct} از {total} ({percentage:.1f}%)\n\n"
-                    f"🏆 **سطح تعیین شده:** {updated_level}\n\n"
+                    f"🏆 **سطح تعیین شده:** {levels_persian.get(profile.level, profile.level)}\n\n"
                     f"✅ سطح شما با موفقیت به‌روزرسانی شد و محتوای آموزشی از این پس متناسب با سطح جدید شما ارائه خواهد شد.\n\n"
                     f"🚀 برای شروع یادگیری، از دکمه‌های زیر استفاده کنید:"
                 ),
@@ -382,7 +437,7 @@ async def send_assessment_question(message: Message, context: ContextTypes.DEFAU
             # Reset state even on DB error
             user_states[user_id] = MAIN_MENU
 
-    db.set_assessment_done(user_id, True)
+    (await get_profile(context, user_id)).set_assessment_done(True)
 
 async def handle_assessment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle assessment answer selection"""
@@ -477,30 +532,14 @@ async def handle_assessment_callback(update: Update, context: ContextTypes.DEFAU
 async def vocabulary_practice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start vocabulary practice."""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    profile = await get_profile(context, user_id)
+    profile.touch()
     
-    # Explicitly log and get the current level
-    level = db.get_user_level(user_id)
+    level = profile.level
     logger.info(f"Starting vocabulary practice for user {user_id} with level '{level}'")
     
-    # Double verify by directly checking the database
-    try:
-        import sqlite3
-        conn = sqlite3.connect("user_data.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT level FROM users WHERE user_id = ?", (user_id,))
-        result = cursor.fetchone()
-        direct_level = result[0] if result else "not found"
-        conn.close()
-        logger.info(f"Direct DB check for user {user_id} level: '{direct_level}'")
-        
-        if direct_level != level:
-            logger.warning(f"Level mismatch for user {user_id}: db.get_user_level='{level}', direct check='{direct_level}'")
-    except Exception as e:
-        logger.error(f"Error in direct DB check: {e}")
-    
     # Get user's vocabulary stats
-    words_studied = db.get_words_studied_count(user_id)
+    words_studied = await async_db.get_words_studied_count(user_id)
     
     # Check if a test is due (after every 20 words)
     if words_studied > 0 and words_studied % 20 == 0:
@@ -570,6 +609,46 @@ async def send_vocabulary_word(message: Message, context: ContextTypes.DEFAULT_T
     
     await message.reply_text(message_text)
 
+def start_feedback_reply(message: Message, prefix=""):
+    """Return a StreamingReply for LLM feedback, or None when streaming is disabled."""
+    if not LLM_STREAMING:
+        return None
+    return StreamingReply(message, prefix=prefix)
+
+# The grammar grading prompt gets the lesson's compact rule summary rather than
+# the full lesson text, trimmed further if needed to fit the grammar token budget
+GRAMMAR_GRADING_TEMPLATE = """You are a strict English grammar teacher. A student is practicing the grammar lesson: "{title}"
+
+Grammar rule being practiced:
+{rule}
+
+The student wrote this sentence: "{answer}"
+
+IMPORTANT EVALUATION RULES:
+- If the sentence contains irrelevant words, random characters, or gibberish: Score 0-25
+- If the specific grammar rule "{title}" is not applied: Maximum score 40
+- If the sentence is grammatically incorrect: Deduct 30-50 points
+- Only give high scores (85+) for perfect application of the grammar rule
+
+Evaluate the student's sentence specifically based on:
+1. Correct application of "{title}" grammar rule (60 points)
+2. Overall grammatical accuracy (25 points)
+3. Natural English expression (15 points)
+
+IMPORTANT: Your evaluation must focus on how well the student applied the specific grammar topic "{title}" that they are currently learning.
+
+Be strict and accurate in scoring. Provide constructive feedback in Persian."""
+
+async def grade_answer(prompt, section, reply=None):
+    """Grade an answer as {'score', 'feedback', 'errors'}, streaming feedback into `reply` when given."""
+    return await grade(llm_client, prompt, section, reply)
+
+async def send_feedback(message: Message, reply, text, reply_markup=None):
+    """Deliver the final feedback text, editing the streamed message if there is one."""
+    if reply is None:
+        return await message.reply_text(text, reply_markup=reply_markup)
+    return await reply.finish(text, reply_markup=reply_markup)
+
 async def handle_vocabulary_practice(update: Update, context: ContextTypes.DEFAULT_TYPE, message: str):
     """Handle user response to vocabulary practice."""
     user_id = update.effective_chat.id
@@ -627,27 +706,33 @@ Evaluate based on these criteria:
 2. Grammar and sentence structure (30 points)
 3. Meaning and coherence (20 points)
 
-Be strict and accurate in scoring. Provide constructive feedback in Persian.
-Format the score clearly at the end, e.g., Score: 75/100."""
-
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}]
-        )
-        logger.info("Gemini call successful for VOCABULARY_PRACTICE")
-        feedback = response.choices[0].message.content
-
-        # Extract score using simple heuristic
-        score = 70  # Default score
-        try:
-            score_part = feedback.split("Score:")[1].split("/")[0].strip()
-            score = int(score_part)
-        except Exception:
-            logger.warning("Could not parse score from Gemini feedback.")
-            pass
+Be strict and accurate in scoring. Provide constructive feedback in Persian."""
+
+        pre_graded = pre_grade_vocabulary(message, current_word)
+        cached = None if pre_graded else grading_cache.get(VOCAB_PROMPT_VERSION, current_word.lower(), message)
+        if pre_graded:
+            # Clearly failing answer, no need to ask OpenAI
+            feedback_reply = None
+            feedback, score = pre_graded['feedback'], pre_graded['score']
+        elif cached:
+            logger.info(f"Grading cache hit for VOCABULARY_PRACTICE word '{current_word}'")
+            feedback_reply = None
+            feedback, score = cached['feedback'], cached['score']
+        else:
+            feedback_reply = start_feedback_reply(update.message)
+            try:
+                grading = await grade_answer(prompt, 'vocabulary', feedback_reply)
+                feedback, score = format_feedback(grading), grading['score']
+                grading_cache.put(VOCAB_PROMPT_VERSION, current_word.lower(), message, feedback, score)
+            except (CircuitOpenError, GradingFormatError) as e:
+                # OpenAI is failing or unusable, grade locally so the learner is not kept waiting
+                logger.warning(f"Grading VOCABULARY_PRACTICE locally: {e}")
+                local_grade = fallback_grade_vocabulary(message, current_word)
+                feedback, score = local_grade['feedback'], local_grade['score']
 
         # Mark this word as studied
-        db.add_word_studied(user_id, current_word, score)
+        db_writer.submit(db.add_word_studied, user_id, current_word, score, content_manager.get_word_id(current_word))
+        await db_writer.write(content_manager.advance_vocab_cursor, user_id, current_word)
         
         # Move to the next word
         context.user_data['current_vocab_index'] = current_index + 1
@@ -659,11 +744,14 @@ Format the score clearly at the end, e.g., Score: 75/100."""
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(feedback, reply_markup=reply_markup)
+        await send_feedback(
+            update.message, feedback_reply, f"{feedback}\n\n🎯 **نمره: {score}/100**", reply_markup=reply_markup
+        )
         
         # --- Incremental progress calculation ---
         # Calculate progress increment for completing one vocabulary word
-        level = db.get_user_level(user_id)
+        profile = await get_profile(context, user_id)
+        level = profile.level
         total_vocab = content_manager.get_total_vocabulary_count(level)
         if total_vocab > 0:
             # Base progress increment for completing one word
@@ -674,7 +762,7 @@ Format the score clearly at the end, e.g., Score: 75/100."""
             final_increment = progress_increment * score_multiplier
             
             db.add_section_progress(user_id, 'vocabulary', level, final_increment)
-        if db.check_and_upgrade_level(user_id):
+        if profile.check_and_upgrade_level():
             await update.message.reply_text("🎉 تبریک! شما به سطح بعدی ارتقاء یافتید.")
     except Exception as e:
         logger.error(f"Error in VOCABULARY_PRACTICE: {str(e)}", exc_info=True)
@@ -683,25 +771,25 @@ Format the score clearly at the end, e.g., Score: 75/100."""
 async def vocabulary_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start or resume a vocabulary test after every 20 words studied."""
     user_id = update.effective_chat.id
-    level = db.get_user_level(user_id)
+    level = (await get_profile(context, user_id)).level
 
     # Check if a test is already in progress for this user
     vocab_test = context.user_data.get('vocab_test')
-    if vocab_test and vocab_test.get('words') and vocab_test.get('current_question', 0) < len(vocab_test['words']):
+    if vocab_test and vocab_test.get('questions') and vocab_test.get('current_question', 0) < len(vocab_test['questions']):
         # Resume the test
         user_states[user_id] = VOCABULARY_TEST
         await update.message.reply_text(
             "🧪 آزمون لغت شما هنوز به پایان نرسیده است. ادامه می‌دهیم..."
         )
-        return await send_vocab_test_question(update.message, context)
+        return await send_vocab_test_question(user_id, context)
 
     # Calculate which test number this should be (1-5 for each level)
-    words_studied = db.get_words_studied_count(user_id)
+    words_studied = await async_db.get_words_studied_count(user_id)
     test_number = (words_studied // 20) % 5 + 1  # Cycles through 1-5
     
-    # Get recent studied words for this test (last 20 studied words)
-    test_words = db.get_recent_studied_words(user_id, 20)
-    if not test_words or len(test_words) < 20:
+    # Build all questions for the last 20 studied words, options included, at once
+    questions = await async_db.build_vocab_test(user_id, level, 20)
+    if len(questions) < 20:
         await update.message.reply_text(
             "برای شرکت در آزمون لغت باید حداقل ۲۰ لغت تمرین کرده باشید."
             " لطفاً ابتدا لغات بیشتری تمرین کنید تا آزمون فعال شود."
@@ -712,7 +800,7 @@ async def vocabulary_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Create a multiple choice test
     context.user_data['vocab_test'] = {
-        'words': test_words,
+        'questions': questions,
         'current_question': 0,
         'correct_answers': 0
     }
@@ -732,30 +820,34 @@ async def vocabulary_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Send the first question
-    await send_vocab_test_question(update.message, context)
+    await send_vocab_test_question(user_id, context)
 
-async def send_vocab_test_question(message: Message, context: ContextTypes.DEFAULT_TYPE):
-    """Send a vocabulary test question."""
-    user_id = message.chat_id
+async def send_vocab_test_question(chat_id, context: ContextTypes.DEFAULT_TYPE):
+    """Send the current vocabulary test question, or the results once all are answered."""
+    user_id = chat_id
     test_data = context.user_data.get('vocab_test', {})
-    test_words = test_data.get('words', [])
+    questions = test_data.get('questions', [])
     current_q = test_data.get('current_question', 0)
 
-    if current_q >= len(test_words):
+    if current_q >= len(questions):
         # Test is complete
         correct = test_data.get('correct_answers', 0)
-        total = len(test_words)
+        total = len(questions)
         score = (correct / total) * 100 if total > 0 else 0
-        level = db.get_user_level(user_id)
+        profile = await get_profile(context, user_id)
+        level = profile.level
         # Update assessment progress
-        db.add_section_progress(user_id, 'assessment', level, score)
+        db_writer.submit(db.add_section_progress, user_id, 'assessment', level, score)
         # Mark these words as tested
-        db.mark_words_tested(user_id, [w['word'] for w in test_words])
+        tested_words = [question[0] for question in questions]
+        db_writer.submit(
+            db.mark_words_tested, user_id, tested_words, [content_manager.get_word_id(word) for word in tested_words]
+        )
         # Update vocabulary progress after test - based on test performance
         total_vocab = content_manager.get_total_vocabulary_count(level)
         if total_vocab > 0:
             # Test covers 20 words, so calculate increment for batch
-            test_words_count = len(test_words)
+            test_words_count = len(questions)
             batch_increment = (test_words_count / total_vocab) * 100
             
             # Apply score multiplier for test performance
@@ -766,7 +858,7 @@ async def send_vocab_test_question(message: Message, context: ContextTypes.DEFAU
         context.user_data['test_completed'] = True  # Mark test as completed
         
         # Calculate test number for display
-        words_studied = db.get_words_studied_count(user_id)
+        words_studied = await async_db.get_words_studied_count(user_id)
         test_number = (words_studied // 20) % 5 + 1
         
         # Reset state
@@ -786,20 +878,14 @@ async def send_vocab_test_question(message: Message, context: ContextTypes.DEFAU
             [InlineKeyboardButton("🏠 منوی اصلی", callback_data="vocab_exit")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await message.reply_text(result_text, reply_markup=reply_markup)
+        await context.bot.send_message(chat_id=chat_id, text=result_text, reply_markup=reply_markup)
         # Check for level up
-        if db.check_and_upgrade_level(user_id):
-            await message.reply_text("🎉 تبریک! شما به سطح بعدی ارتقاء یافتید.")
+        if profile.check_and_upgrade_level():
+            await context.bot.send_message(chat_id=chat_id, text="🎉 تبریک! شما به سطح بعدی ارتقاء یافتید.")
         return
 
-    # Get current word
-    word = test_words[current_q]
-
-    # Generate incorrect options
-    all_definitions = db.get_random_definitions(user_id, 3)
-    options = [word['definition']] + all_definitions
-    import random
-    random.shuffle(options)
+    # Options were picked when the test was built
+    word, options, _ = questions[current_q]
 
     # Create keyboard with options
     keyboard = []
@@ -810,12 +896,29 @@ async def send_vocab_test_question(message: Message, context: ContextTypes.DEFAU
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     # Send question
-    await message.reply_text(
-        f"سوال {current_q + 1} از {len(test_words)}:\n\n"
-        f"معنی لغت '{word['word']}' را انتخاب کنید:",
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=f"سوال {current_q + 1} از {len(questions)}:\n\n"
+             f"معنی لغت '{word}' را انتخاب کنید:",
         reply_markup=reply_markup
     )
 
+async def send_next_vocab_question(context: ContextTypes.DEFAULT_TYPE):
+    """Job: send the next vocabulary test question after the answer feedback pause."""
+    job = context.job
+    chat_id = job.chat_id
+    # Jobs run outside update processing, so take the user's lock and session ourselves
+    async with user_lock(context.application, chat_id):
+        session_sync.load_user(chat_id, context.user_data)
+        try:
+            test_data = context.user_data.get('vocab_test') or {}
+            # The user may have left or restarted the test in the meantime
+            if user_states.get(chat_id) != VOCABULARY_TEST or test_data.get('current_question') != job.data:
+                return
+            await send_vocab_test_question(chat_id, context)
+        finally:
+            session_sync.save_user(chat_id, context.user_data)
+
 async def handle_vocab_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle vocabulary callbacks (next word, skip, test answers, test navigation)"""
     query = update.callback_query
@@ -852,10 +955,10 @@ async def handle_vocab_callback(update: Update, context: ContextTypes.DEFAULT_TY
         selected_option_index = int(parts[3])
 
         test_data = context.user_data.get('vocab_test', {})
-        test_words = test_data.get('words', [])
+        questions = test_data.get('questions', [])
         current_q = test_data.get('current_question', 0)
 
-        if question_index != current_q:
+        if question_index != current_q or current_q >= len(questions):
             # Outdated callback
             await query.edit_message_text(
                 f"{query.message.text}\n\n-- این سوال قبلاً پاسخ داده شده است --",
@@ -864,9 +967,8 @@ async def handle_vocab_callback(update: Update, context: ContextTypes.DEFAULT_TY
             return
 
         # Get correct answer
-        correct_definition = test_words[current_q]['definition']
-        options = [button[0].text for button in query.message.reply_markup.inline_keyboard]
-        correct_option_index = options.index(correct_definition) if correct_definition in options else -1
+        _, options, correct_option_index = questions[current_q]
+        correct_definition = options[correct_option_index]
 
         # Check if answer is correct
         is_correct = selected_option_index == correct_option_index
@@ -885,22 +987,27 @@ async def handle_vocab_callback(update: Update, context: ContextTypes.DEFAULT_TY
         test_data['current_question'] = current_q + 1
         context.user_data['vocab_test'] = test_data
 
-        # Send next question after a short delay
-        import asyncio
-        await asyncio.sleep(2)
-        await send_vocab_test_question(query.message, context)
+        # Send the next question after a short pause without holding up this handler
+        chat_id = query.message.chat_id
+        if context.job_queue:
+            context.job_queue.run_once(
+                send_next_vocab_question, VOCAB_TEST_PACING_SECONDS,
+                chat_id=chat_id, user_id=chat_id, data=current_q + 1
+            )
+        else:
+            await send_vocab_test_question(chat_id, context)
 
 async def grammar_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send grammar lesson with exercises."""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    profile = await get_profile(context, user_id)
+    profile.touch()
     
-    # Get and verify level
-    level = db.get_user_level(user_id)
+    level = profile.level
     logger.info(f"Starting grammar lesson for user {user_id} with level '{level}'")
     
     # Get the next uncompleted grammar lesson
-    lesson = content_manager.get_grammar_lesson_for_level(user_id, level)
+    lesson = await async_db.get_grammar_lesson_for_level(user_id, level)
     
     if not lesson:
         await update.message.reply_text(
@@ -916,6 +1023,7 @@ async def grammar_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['current_grammar_lesson'] = {
         'title': lesson['title'],
         'content': lesson['content'],
+        'rule_summary': lesson.get('rule_summary'),
         'level': lesson['level'],
         'topic_id': lesson['topic_id'],
         'exercises_completed': 0,
@@ -935,10 +1043,11 @@ async def grammar_lesson(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def conversation_practice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start or continue advanced conversation practice using OpenAI."""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    profile = await get_profile(context, user_id)
+    profile.touch()
     logger.info(f"Starting/continuing conversation practice for user {user_id}")
 
-    level = db.get_user_level(user_id)
+    level = profile.level
     topic_data = content_manager.get_fallback_conversation_topics(user_id, level)
     user_states[user_id] = CONVERSATION_PRACTICE
 
@@ -969,14 +1078,15 @@ async def conversation_practice(update: Update, context: ContextTypes.DEFAULT_TY
 async def show_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user progress."""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    profile = await get_profile(context, user_id)
+    profile.touch()
     
     # Get user level
-    level = db.get_user_level(user_id)
+    level = profile.level
     level_persian = levels_persian.get(level, level)
     
     # Get progress data
-    progress = db.get_user_progress(user_id)
+    progress = await async_db.get_user_progress(user_id)
     
     # Create progress bars for current level
     categories = {
@@ -1000,7 +1110,7 @@ async def show_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
         current_level_progress.append(score)
     
     # Check if eligible for upgrade (only if no recent assessment)
-    has_recent_assessment = db.has_recent_assessment(user_id, 24)
+    has_recent_assessment = await async_db.has_recent_assessment(user_id, 24)
     
     if level != 'advanced' and not has_recent_assessment:
         all_above_80 = all(score >= 80 for score in current_level_progress)
@@ -1025,48 +1135,94 @@ async def show_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     await update.message.reply_text(message)
 
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle general messages and continue conversations."""
-    user_id = update.effective_chat.id
-    db.update_last_active(user_id)
-    logger.info(f"Received message from user {user_id}")
+async def run_conversation_turn(level, topic, user_reply, message_number, feedback_reply=None):
+    """Score a conversation message and generate the teacher's follow-up.
 
-    message = update.message.text
-    state = user_states.get(user_id, MAIN_MENU)
-    logger.info(f"User {user_id} state: {state}")
+    Returns (grading, teacher_reply) where grading has 'score' and 'feedback'.
+    Both completions are requested concurrently, so a turn takes roughly as
+    long as the slower call instead of the sum of both. The teacher reply is
+    skipped after the last message of the session and returned as None.
+    When feedback_reply is given, the score feedback is streamed into it.
+    While the OpenAI circuit is open, local feedback and a templated
+    follow-up question are used instead.
+    """
+    score_prompt = f"""You are a strict English teacher helping a {level}-level Iranian student practice conversation.
 
-    # Check if assessment is done
-    assessment_done = db.is_assessment_done(user_id)
-    if not assessment_done:
-        if message == "🧪 شروع سنجش سطح" or message == "🧪 سنجش سطح":
-            await assess_level(update, context)
-            return
-        else:
-            await update.message.reply_text("برای شروع یادگیری، ابتدا باید آزمون تعیین سطح را انجام دهید. لطفاً روی دکمه \"🧪 شروع سنجش سطح\" کلیک کنید.")
-            return
+Topic: "{topic['title']}"
+Topic Description: "{topic['description']}"
+Student's message #{message_number}: "{user_reply}"
 
-    # Handle button presses
+IMPORTANT EVALUATION RULES:
+- If the message contains irrelevant words, random characters, or gibberish: Score 0-30
+- If the message is completely off-topic: Maximum score 40
+- If there are major grammar errors: Deduct 25-40 points
+- Only give high scores (80+) for genuinely good conversational responses
+
+Please evaluate the student's response based on:
+1. Grammar accuracy and sentence structure (40 points)
+2. Vocabulary usage and appropriateness (30 points)
+3. Relevance to the conversation topic (20 points)
+4. Fluency and natural expression (10 points)
+
+Be strict and accurate in scoring. Provide constructive feedback in Persian, pointing out specific areas for improvement.
+Keep your feedback concise but helpful."""
+
+    async def score_task():
+        try:
+            return await grade_answer(score_prompt, 'conversation', feedback_reply)
+        except (CircuitOpenError, GradingFormatError) as e:
+            logger.warning(f"Grading CONVERSATION_PRACTICE locally: {e}")
+            return fallback_grade_conversation(user_reply)
+
+    if message_number >= 4:  # Only send AI reply if not the last message
+        return await score_task(), None
+
+    ai_conversation_prompt = f"""You are an English teacher practicing conversation with a {level}-level Iranian student.
+
+Topic: "{topic['title']}"
+Topic Description: "{topic['description']}"
+Student's message: "{user_reply}"
+
+Respond naturally in English as if you're having a conversation about this topic. Ask a follow-up question or make a relevant comment to keep the conversation going. Keep your response appropriate for a {level} level student.
+
+Your response should be 1-2 sentences that encourage further conversation."""
+
+    reply_task = llm_client.complete(ai_conversation_prompt, section='conversation_reply')
+    grading, ai_reply = await asyncio.gather(score_task(), reply_task, return_exceptions=True)
+    if isinstance(grading, Exception):
+        raise grading
+    if isinstance(ai_reply, CircuitOpenError):
+        ai_reply = fallback_teacher_reply(topic['title'])
+    elif isinstance(ai_reply, Exception):
+        # The student still gets their score if only the follow-up failed
+        logger.error(f"Teacher reply generation failed: {ai_reply}")
+        ai_reply = None
+    return grading, ai_reply
+
+async def dispatch_menu_button(update: Update, context: ContextTypes.DEFAULT_TYPE, message: str) -> bool:
+    """Run the handler for a menu button label. Returns False if message is not a button."""
+    user_id = update.effective_chat.id
     if message == "📚 تمرین لغات":
         await vocabulary_practice(update, context)
-        return
+        return True
     elif message == "📝 درس گرامر":
         await grammar_lesson(update, context)
-        return
+        return True
     elif message == "🗣️ تمرین مکالمه":
         await conversation_practice(update, context)
-        return
+        return True
     elif message == "📊 پیشرفت من":
         await show_progress(update, context)
-        return
+        return True
     elif message == "🧪 سنجش سطح":
         await assess_level(update, context)
-        return
+        return True
     elif message == "❓ راهنما":
         await help_command(update, context)
-        return
+        return True
     elif message == "📚 ادامه تمرین با لغات جدید":
         await vocabulary_practice(update, context)
-        return
+        return True
     elif message == "🔄 بازگشت به منوی اصلی":
         user_states[user_id] = MAIN_MENU
         keyboard = [
@@ -1077,6 +1233,32 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         
         await update.message.reply_text("بازگشت به منوی اصلی:", reply_markup=reply_markup)
+        return True
+    return False
+
+async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle general messages and continue conversations."""
+    user_id = update.effective_chat.id
+    profile = await get_profile(context, user_id)
+    profile.touch()
+    logger.info(f"Received message from user {user_id}")
+
+    message = update.message.text
+    state = user_states.get(user_id, MAIN_MENU)
+    logger.info(f"User {user_id} state: {state}")
+
+    # Check if assessment is done
+    assessment_done = profile.assessment_done
+    if not assessment_done:
+        if message == "🧪 شروع سنجش سطح" or message == "🧪 سنجش سطح":
+            await assess_level(update, context)
+            return
+        else:
+            await update.message.reply_text("برای شروع یادگیری، ابتدا باید آزمون تعیین سطح را انجام دهید. لطفاً روی دکمه \"🧪 شروع سنجش سطح\" کلیک کنید.")
+            return
+
+    # Handle button presses
+    if await dispatch_menu_button(update, context, message):
         return
     
     # Handle state-specific messages
@@ -1116,62 +1298,37 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logger.info(f"Calling OpenAI for GRAMMAR_LESSON exercise {exercises_completed + 1}...")
             
             # Construct prompt for AI evaluation
-            prompt = f"""You are a strict English grammar teacher. A student is practicing the grammar lesson: "{lesson_info['title']}"
-
-Grammar rule being practiced:
-{lesson_info['content']}
-
-The student wrote this sentence: "{message}"
-
-IMPORTANT EVALUATION RULES:
-- If the sentence contains irrelevant words, random characters, or gibberish: Score 0-25
-- If the specific grammar rule "{lesson_info['title']}" is not applied: Maximum score 40
-- If the sentence is grammatically incorrect: Deduct 30-50 points
-- Only give high scores (85+) for perfect application of the grammar rule
-
-Evaluate the student's sentence specifically based on:
-1. Correct application of "{lesson_info['title']}" grammar rule (60 points)
-2. Overall grammatical accuracy (25 points)
-3. Natural English expression (15 points)
-
-IMPORTANT: Your evaluation must focus on how well the student applied the specific grammar topic "{lesson_info['title']}" that they are currently learning.
-
-Be strict and accurate in scoring. Provide constructive feedback in Persian.
-Format the score clearly at the end, e.g., Score: 70/100."""
-
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
+            prompt = render_with_budget(
+                GRAMMAR_GRADING_TEMPLATE, 'grammar', 'rule',
+                title=lesson_info['title'],
+                rule=lesson_info.get('rule_summary') or summarize_grammar_rule(lesson_info['content']),
+                answer=message
             )
-            logger.info("OpenAI call successful for GRAMMAR_LESSON")
-            feedback = response.choices[0].message.content
 
-            # Extract score with multiple parsing attempts
-            score = 70  # Default score
-            try:
-                # Try different score patterns
-                import re
-                score_patterns = [
-                    r"Score:\s*(\d+)/100",
-                    r"Score:\s*(\d+)",
-                    r"نمره:\s*(\d+)",
-                    r"امتیاز:\s*(\d+)",
-                    r"(\d+)/100",
-                    r"(\d+)\s*از\s*100"
-                ]
-                
-                for pattern in score_patterns:
-                    match = re.search(pattern, feedback, re.IGNORECASE)
-                    if match:
-                        score = int(match.group(1))
-                        logger.info(f"Successfully parsed score: {score} using pattern: {pattern}")
-                        break
-                else:
-                    logger.warning(f"Could not parse score from feedback: {feedback[:200]}...")
-                    
-            except Exception as e:
-                logger.warning(f"Error parsing score: {e}")
-                pass
+            lesson_key = f"{level}:{topic_id}"
+            pre_graded = pre_grade_grammar(message, lesson_info['title'])
+            cached = None if pre_graded else grading_cache.get(GRAMMAR_PROMPT_VERSION, lesson_key, message)
+            if pre_graded:
+                # Clearly failing answer, no need to ask OpenAI
+                feedback_reply = None
+                feedback, score = pre_graded['feedback'], pre_graded['score']
+            elif cached:
+                logger.info(f"Grading cache hit for GRAMMAR_LESSON {lesson_key}")
+                feedback_reply = None
+                feedback, score = cached['feedback'], cached['score']
+            else:
+                feedback_reply = start_feedback_reply(
+                    update.message, prefix=f"📊 **نتیجه تمرین {exercises_completed + 1}:**\n\n"
+                )
+                try:
+                    grading = await grade_answer(prompt, 'grammar', feedback_reply)
+                    feedback, score = format_feedback(grading), grading['score']
+                    grading_cache.put(GRAMMAR_PROMPT_VERSION, lesson_key, message, feedback, score)
+                except (CircuitOpenError, GradingFormatError) as e:
+                    # OpenAI is failing or unusable, grade locally so the learner is not kept waiting
+                    logger.warning(f"Grading GRAMMAR_LESSON locally: {e}")
+                    local_grade = fallback_grade_grammar(message, lesson_info['title'])
+                    feedback, score = local_grade['feedback'], local_grade['score']
 
             # Update lesson progress
             exercises_completed += 1
@@ -1181,7 +1338,9 @@ Format the score clearly at the end, e.g., Score: 70/100."""
             context.user_data['current_grammar_lesson']['total_score'] = total_score
 
             # Show individual exercise score
-            await update.message.reply_text(
+            await send_feedback(
+                update.message,
+                feedback_reply,
                 f"📊 **نتیجه تمرین {exercises_completed}:**\n\n"
                 f"{feedback}\n\n"
                 f"🎯 **نمره این تمرین: {score}/100**"
@@ -1209,7 +1368,9 @@ Format the score clearly at the end, e.g., Score: 70/100."""
                 logger.info(f"🔧 [DEBUG] Grammar lesson completed: user={user_id}, level={level}, topic_id={topic_id}, avg_score={avg_score}")
                 
                 # Mark lesson as completed
-                completion_success = content_manager.mark_grammar_lesson_completed(user_id, level, topic_id, avg_score)
+                completion_success = await db_writer.write(
+                    content_manager.mark_grammar_lesson_completed, user_id, level, topic_id, avg_score
+                )
                 logger.info(f"🔧 [DEBUG] Lesson completion result: {completion_success}")
                 
                 # --- New Progress Calculation Logic ---
@@ -1223,7 +1384,7 @@ Format the score clearly at the end, e.g., Score: 70/100."""
                     logger.info(f"🔧 [DEBUG] Progress increment calculated: {progress_increment}%")
                     
                     # Add the calculated increment to the user's grammar progress
-                    current_progress = db.get_section_progress(user_id, 'grammar', level)
+                    current_progress = await async_db.get_section_progress(user_id, 'grammar', level)
                     logger.info(f"🔧 [DEBUG] Current grammar progress: {current_progress}%")
                     
                     new_progress = db.add_section_progress(user_id, 'grammar', level, progress_increment)
@@ -1233,7 +1394,7 @@ Format the score clearly at the end, e.g., Score: 70/100."""
                 # --- End of New Logic ---
                 
                 # Check for level up
-                if db.check_and_upgrade_level(user_id):
+                if profile.check_and_upgrade_level():
                     await update.message.reply_text("🎉 تبریک! شما به سطح بعدی ارتقاء یافتید.")
                 
                 # Reset state to main menu after completion
@@ -1275,7 +1436,7 @@ Format the score clearly at the end, e.g., Score: 70/100."""
                 await update.message.reply_text("⚠️ لطفاً فقط به انگلیسی پاسخ دهید.")
                 return
             topic = context.user_data.get('conversation_topic', '')
-            level = db.get_user_level(user_id)
+            level = profile.level
             # Initialize conversation state if not present
             if 'conversation_history' not in context.user_data:
                 context.user_data['conversation_history'] = []
@@ -1305,7 +1466,7 @@ Format the score clearly at the end, e.g., Score: 70/100."""
                 # --- End of New Logic ---
                 
                 # Check for level upgrade
-                if db.check_and_upgrade_level(user_id):
+                if profile.check_and_upgrade_level():
                     await update.message.reply_text("🎉 تبریک! شما به سطح بعدی ارتقاء یافتید.")
                 
                 # Show completion message with detailed results
@@ -1332,86 +1493,29 @@ Format the score clearly at the end, e.g., Score: 70/100."""
             # Score and provide feedback for the user's reply
             current_message_number = len(context.user_data['conversation_history']) + 1
             
-            score_prompt = f"""You are a strict English teacher helping a {level}-level Iranian student practice conversation.
-
-Topic: "{topic['title']}"
-Topic Description: "{topic['description']}"
-Student's message #{current_message_number}: "{user_reply}"
-
-IMPORTANT EVALUATION RULES:
-- If the message contains irrelevant words, random characters, or gibberish: Score 0-30
-- If the message is completely off-topic: Maximum score 40
-- If there are major grammar errors: Deduct 25-40 points
-- Only give high scores (80+) for genuinely good conversational responses
-
-Please evaluate the student's response based on:
-1. Grammar accuracy and sentence structure (40 points)
-2. Vocabulary usage and appropriateness (30 points)
-3. Relevance to the conversation topic (20 points)
-4. Fluency and natural expression (10 points)
-
-Be strict and accurate in scoring. Provide constructive feedback in Persian, pointing out specific areas for improvement.
-End your response with: Score: XX/100
-
-Keep your feedback concise but helpful."""
-
-            score_response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": score_prompt}]
+            # Scoring and the teacher's follow-up run concurrently
+            feedback_reply = start_feedback_reply(
+                update.message, prefix=f"📊 **ارزیابی پیام {current_message_number}:**\n\n"
             )
-            score_feedback = score_response.choices[0].message.content
-            
-            # Extract score with multiple parsing attempts (same as grammar)
-            score = 70  # Default score
-            try:
-                import re
-                score_patterns = [
-                    r"Score:\s*(\d+)/100",
-                    r"Score:\s*(\d+)",
-                    r"نمره:\s*(\d+)",
-                    r"امتیاز:\s*(\d+)",
-                    r"(\d+)/100",
-                    r"(\d+)\s*از\s*100"
-                ]
-                
-                for pattern in score_patterns:
-                    match = re.search(pattern, score_feedback, re.IGNORECASE)
-                    if match:
-                        score = int(match.group(1))
-                        logger.info(f"Successfully parsed conversation score: {score} using pattern: {pattern}")
-                        break
-                else:
-                    logger.warning(f"Could not parse score from conversation feedback: {score_feedback[:200]}...")
-                    
-            except Exception as e:
-                logger.warning(f"Error parsing conversation score: {e}")
-                pass
+            grading, ai_reply = await run_conversation_turn(
+                level, topic, user_reply, current_message_number, feedback_reply
+            )
+            score = grading['score']
             
             # Store score and message
             context.user_data['conversation_scores'].append(score)
             context.user_data['conversation_history'].append(user_reply)
             
             # Send feedback to user
-            await update.message.reply_text(f"📊 **ارزیابی پیام {current_message_number}:**\n\n{score_feedback}")
+            await send_feedback(
+                update.message,
+                feedback_reply,
+                f"📊 **ارزیابی پیام {current_message_number}:**\n\n{format_feedback(grading)}\n\n"
+                f"🎯 **نمره: {score}/100**"
+            )
             
-            # Generate AI response to continue the conversation
-            if current_message_number < 4:  # Only send AI reply if not the last message
-                ai_conversation_prompt = f"""You are an English teacher practicing conversation with a {level}-level Iranian student.
-
-Topic: "{topic['title']}"
-Topic Description: "{topic['description']}"
-Student's message: "{user_reply}"
-
-Respond naturally in English as if you're having a conversation about this topic. Ask a follow-up question or make a relevant comment to keep the conversation going. Keep your response appropriate for a {level} level student.
-
-Your response should be 1-2 sentences that encourage further conversation."""
-
-                ai_reply_response = openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[{"role": "user", "content": ai_conversation_prompt}]
-                )
-                ai_reply = ai_reply_response.choices[0].message.content
-                
+            # Continue the conversation with the teacher's reply
+            if ai_reply:
                 await update.message.reply_text(f"🤖 **Teacher's Response:**\n\n{ai_reply}\n\n💬 **پیام {current_message_number + 1} خود را بنویسید:**")
                 context.user_data['conversation_ai_replies'] += 1
         except Exception as e:
@@ -1419,6 +1523,15 @@ Your response should be 1-2 sentences that encourage further conversation."""
             await update.message.reply_text("متأسفانه در پردازش پیام شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید.")
     
     else:  # MAIN_MENU or any other state
+        # Answer common intents locally; only open-ended messages need the LLM
+        intent = intent_router.route(message)
+        if intent:
+            logger.info(f"MAIN_MENU message from user {user_id} routed locally as '{intent['intent']}'")
+            if intent['button'] and await dispatch_menu_button(update, context, intent['button']):
+                return
+            if intent['reply']:
+                await update.message.reply_text(intent['reply'])
+                return
         try: # This try needs its own except
             logger.info(f"Calling Gemini for MAIN_MENU...")
             # Construct prompt for Gemini
@@ -1426,12 +1539,10 @@ Your response should be 1-2 sentences that encourage further conversation."""
 The student sent this message outside of a specific task: "{message}"
 Respond briefly and politely in Persian. Gently suggest they use the menu buttons (تمرین لغات, درس گرامر, تمرین مکالمه, سنجش سطح) to practice specific skills."""
 
-            response = openai_client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            logger.info("Gemini call successful for MAIN_MENU")
-            reply = response.choices[0].message.content
+            try:
+                reply = await llm_client.complete(prompt, section='main_menu')
+            except CircuitOpenError:
+                reply = MENU_HINT
             # The await needs to be inside the try block if it depends on 'reply'
             await update.message.reply_text(reply)
         # This except corresponds to the try block above
@@ -1440,9 +1551,7 @@ Respond briefly and politely in Persian. Gently suggest they use the menu button
             await update.message.reply_text("متأسفانه در پردازش پیام شما مشکلی پیش آمد. لطفاً دوباره تلاش کنید.")
 
 async def send_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
-    """Send daily reminder to all active users."""
-    user_ids = db.get_users_with_notifications()
-    
+    """Send daily reminder to all users with notifications enabled."""
     reminder_message = """
 یادآوری روزانه یادگیری زبان انگلیسی 📚✨
 
@@ -1453,16 +1562,19 @@ async def send_daily_reminder(context: ContextTypes.DEFAULT_TYPE):
 
 موفق باشید! 💪
 """
-    for user_id in user_ids:
-        try:
-            await context.bot.send_message(chat_id=user_id, text=reminder_message)
-        except Exception as e:
-            print(f"Failed to send reminder to {user_id}: {e}")
+    broadcaster = Broadcaster(
+        context.bot,
+        rate=float(os.getenv('BROADCAST_RATE', '25')),
+        concurrency=int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+    )
+    stats = await broadcaster.run(db.get_notification_page, reminder_message)
+    # Stop reminding users who blocked the bot
+    db.disable_notifications(stats.blocked_user_ids)
 
 async def set_level_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Command to check or set user level (debug)"""
     user_id = update.effective_chat.id
-    db.update_last_active(user_id)
+    (await get_profile(context, user_id)).touch()
     
     # If no arguments, show current level
     if not context.args:
@@ -1501,8 +1613,7 @@ async def debug_db_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Check if user exists in the database
     try:
-        import sqlite3
-        conn = sqlite3.connect("user_data.db")
+        conn = db_connection.connect("user_data.db")
         cursor = conn.cursor()
         
         # Get database tables
@@ -1667,7 +1778,7 @@ async def fix_level_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(f"سطح فعلی شما: {levels_persian.get(current_level, current_level)}")
     
     # Get the latest assessment result
-    latest_level, latest_score = db.get_latest_assessment_result(user_id)
+    latest_level, latest_score = await async_db.get_latest_assessment_result(user_id)
     
     if not latest_level:
         await update.message.reply_text(
@@ -1743,7 +1854,7 @@ async def create_test_assessment_command(update: Update, context: ContextTypes.D
     await update.message.reply_text(f"در حال ایجاد یک نتیجه آزمون آزمایشی با نمره {score}% (سطح {level})...")
     
     # Save the test assessment record
-    success, error = db.save_assessment_result(user_id, score)
+    success, error = await db_writer.write(db.save_assessment_result, user_id, score)
     
     if success:
         await update.message.reply_text(
@@ -1770,6 +1881,36 @@ async def create_test_assessment_command(update: Update, context: ContextTypes.D
     else:
         await update.message.reply_text("⚠️ هشدار: حتی پس از ذخیره‌سازی، هیچ سابقه آزمونی در پایگاه داده یافت نشد.")
 
+async def purge_expired_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """Remove expired sessions from the state store."""
+    removed = state_store.purge_expired()
+    if removed:
+        logger.info(f"Purged {removed} expired user sessions")
+
+async def flush_db_writes(context: ContextTypes.DEFAULT_TYPE):
+    """Write buffered database updates even when no new writes arrive."""
+    db.maybe_flush_writes()
+
+async def post_init(application: Application):
+    """Start background tasks that need the running event loop."""
+    db_writer.start()
+
+async def post_shutdown(application: Application):
+    """Release shared resources once the application has stopped."""
+    await db_writer.close()
+    logger.info(f"Database writer stats: {db_writer.stats()}")
+    db.flush_writes()
+    if write_buffer:
+        logger.info(f"Database write buffer stats: {write_buffer.stats()}")
+    await llm_client.close()
+    logger.info(f"LLM circuit breaker stats: {llm_client.breakers.stats()}")
+    logger.info(f"Grading cache stats: {grading_cache.stats()}")
+    grading_cache.close()
+    state_store.close()
+    logger.info(f"Async database read stats: {async_db.stats()}")
+    async_db.close()
+    db_connection.close_all()
+
 def main():
     """Start the bot."""
     # Configure logging basic setup
@@ -1782,7 +1923,34 @@ def main():
     # proxy_url = "http://your_proxy:port"
     # application = Application.builder().token(TOKEN).proxy_url(proxy_url).read_timeout(30).write_timeout(30).connect_timeout(30).build()
     
-    application = Application.builder().token(TOKEN).read_timeout(30).write_timeout(30).connect_timeout(30).build()
+    builder = (
+        Application.builder()
+        .token(TOKEN)
+        .read_timeout(30)
+        .write_timeout(30)
+        .connect_timeout(30)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+
+    # Process updates from different users concurrently; updates from the same
+    # user stay in order. Set BOT_CONCURRENT_UPDATES=1 for sequential handling.
+    # The per-user processor is installed in both modes: jobs such as the
+    # vocabulary test pacing take its user lock before touching a session.
+    concurrent_updates = max(int(os.getenv('BOT_CONCURRENT_UPDATES', '64')), 1)
+    max_pending_per_user = int(os.getenv('BOT_MAX_PENDING_PER_USER', '8'))
+    if concurrent_updates > 1:
+        processor = PerUserUpdateProcessor(concurrent_updates, max_pending_per_user=max_pending_per_user)
+        logger.info(f"Concurrent update processing enabled ({concurrent_updates} updates at once)")
+    else:
+        processor = PerUserUpdateProcessor(1, max_pending_updates=1, max_pending_per_user=max_pending_per_user)
+    builder = builder.concurrent_updates(processor)
+
+    application = builder.build()
+
+    # Load each user's session before any handler runs and save it after all of them
+    application.add_handler(TypeHandler(Update, session_sync.load), group=-1)
+    application.add_handler(TypeHandler(Update, session_sync.save), group=100)
 
     # Add command handlers
     application.add_handler(CommandHandler("start", start))
@@ -1804,14 +1972,55 @@ def main():
     job_queue = application.job_queue
     if job_queue:
         job_queue.run_daily(send_daily_reminder, time=time(0, 0))
+        job_queue.run_repeating(purge_expired_sessions, interval=3600, first=60)
+        if write_buffer:
+            job_queue.run_repeating(flush_db_writes, interval=write_buffer.flush_interval)
         logger.info("Daily reminder job scheduled.")
     else:
         logger.warning("JobQueue not available, daily reminders will not be sent")
 
-    # Start the Bot
+    # Start the Bot. BOT_MODE=webhook serves updates over HTTPS so several
+    # instances can sit behind a reverse proxy; polling stays the default.
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        run_webhook_mode(application)
+        return
     logger.info("Starting bot polling...")
     application.run_polling()
     logger.info("Bot polling has ended.")
 
+def run_webhook_mode(application: Application):
+    """Serve updates through the embedded webhook server until stopped."""
+    # tornado is only needed in webhook mode (python-telegram-bot[webhooks])
+    from webhook_server import run_webhook
+
+    base_url = os.getenv('WEBHOOK_URL')
+    if not base_url:
+        logger.error("Error: BOT_MODE=webhook requires WEBHOOK_URL (public HTTPS base URL).")
+        exit()
+    url_path = os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+    secret_token = os.getenv('WEBHOOK_SECRET')
+    if not secret_token:
+        # Instances behind one proxy must share a secret, so set WEBHOOK_SECRET there
+        secret_token = secrets.token_urlsafe(32)
+        logger.warning("WEBHOOK_SECRET not set, using a random secret token for this run")
+
+    logger.info("Starting bot in webhook mode...")
+    asyncio.run(run_webhook(
+        application,
+        webhook_url=f"{base_url.rstrip('/')}/{url_path}",
+        url_path=url_path,
+        listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+        port=int(os.getenv('WEBHOOK_PORT', '8443')),
+        secret_token=secret_token,
+        max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+        health_path=os.getenv('WEBHOOK_HEALTH_PATH', 'health'),
+        health_cache_seconds=float(os.getenv('WEBHOOK_HEALTH_CACHE_SECONDS', '5')),
+        extra_status=lambda: {
+            'llm_circuits': llm_client.breakers.stats(),
+            'grading_cache': grading_cache.stats()
+        }
+    ))
+    logger.info("Webhook server has stopped.")
+
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -332,7 +332,12 @@ class AnalyticsMiddleware:
 
 # Health check endpoint for monitoring
 def get_health_status():
-    """Get current health status of the bot."""
+    """Get current health status of the bot.
+
+    Only as complete as what is recorded into bot_analytics: bot.py does not
+    feed it handler, OpenAI or database calls, so there the score reflects
+    host metrics alone.
+    """
     try:
         current_metrics = bot_analytics.get_real_time_metrics()
         performance_report = bot_analytics.monitor.get_performance_report(hours=1)
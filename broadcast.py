@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Rate-limited broadcast of one message to many users
+Sends with a pool of concurrent workers behind a global token bucket so the
+bot stays under Telegram's ~30 messages/second limit, honours RetryAfter,
+retries network errors with backoff and pages through recipients by user_id
+instead of loading them all at once.
+"""
+
+import time
+import random
+import asyncio
+import logging
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds`, e.g. after a RetryAfter."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BroadcastStats:
+    """Progress and failure counters for one broadcast."""
+
+    def __init__(self):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.retry_after_waits = 0
+        self.blocked_user_ids = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    def as_dict(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return {
+            'queued': self.queued,
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'retries': self.retries,
+            'retry_after_waits': self.retry_after_waits,
+            'elapsed_seconds': round(elapsed, 1),
+            'messages_per_second': round(self.sent / elapsed, 1) if elapsed else 0.0
+        }
+
+
+class Broadcaster:
+    """Send one text to every user returned by a paged recipient source."""
+
+    def __init__(self, bot, rate=25, concurrency=20, max_retries=3, base_backoff=1.0, page_size=1000):
+        """rate is the global messages/second cap (Telegram allows about 30),
+        concurrency the number of requests in flight and max_retries the
+        number of retries for network errors and RetryAfter responses."""
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.page_size = page_size
+
+    async def send(self, chat_id, text, stats):
+        """Send to one chat, retrying transient errors; never raises TelegramError."""
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                stats.sent += 1
+                return
+            except RetryAfter as e:
+                # Flood control applies to the whole bot, so every worker waits
+                stats.retry_after_waits += 1
+                self.bucket.pause(float(e.retry_after))
+            except (Forbidden, BadRequest) as e:
+                if isinstance(e, BadRequest) and "chat not found" not in str(e).lower():
+                    stats.failed += 1
+                    logger.warning(f"Failed to send to {chat_id}: {e}")
+                    return
+                # Blocked the bot, deactivated or chat not found: retrying won't help
+                stats.blocked += 1
+                stats.blocked_user_ids.append(chat_id)
+                logger.info(f"Not delivering to {chat_id}: {e}")
+                return
+            except NetworkError as e:
+                if attempt < self.max_retries:
+                    delay = self.base_backoff * (2 ** attempt)
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                logger.warning(f"Network error sending to {chat_id} (attempt {attempt + 1}): {e}")
+            except TelegramError as e:
+                stats.failed += 1
+                logger.warning(f"Failed to send to {chat_id}: {e}")
+                return
+            if attempt < self.max_retries:
+                stats.retries += 1
+        stats.failed += 1
+        logger.warning(f"Giving up on {chat_id} after {self.max_retries + 1} attempts")
+
+    async def run(self, fetch_page, text):
+        """Broadcast `text` to every user ID from fetch_page(after_user_id, limit).
+
+        fetch_page must return user IDs in ascending order; an empty list ends
+        the broadcast. Returns the BroadcastStats.
+        """
+        stats = BroadcastStats()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                try:
+                    if chat_id is None:
+                        return
+                    await self.send(chat_id, text, stats)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            after_user_id = 0
+            while True:
+                page = fetch_page(after_user_id, self.page_size)
+                if not page:
+                    break
+                for chat_id in page:
+                    await queue.put(chat_id)
+                stats.queued += len(page)
+                after_user_id = page[-1]
+                logger.info(f"Broadcast progress: {stats.as_dict()}")
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        stats.finished = time.monotonic()
+        logger.info(f"Broadcast finished: {stats.as_dict()}")
+        return stats
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker for OpenAI calls
+Tracks recent failures and slow calls per bot section; once a section's error
+or slow-call rate crosses its threshold, calls fail fast with CircuitOpenError
+so handlers can fall back to local grading instead of waiting out timeouts.
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling OpenAI while a section's circuit is open."""
+
+    def __init__(self, section, retry_after):
+        super().__init__(f"Circuit for {section} is open, retry in {retry_after:.0f}s")
+        self.section = section
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker with half-open probing."""
+
+    def __init__(self, name, window_seconds=60, min_calls=10, error_rate_threshold=0.5,
+                 slow_call_ms=10000, slow_rate_threshold=0.8, open_seconds=30,
+                 half_open_max_calls=1):
+        """Create a closed breaker.
+
+        The circuit opens when, over the last window_seconds and at least
+        min_calls calls, the failure rate reaches error_rate_threshold or the
+        rate of calls slower than slow_call_ms reaches slow_rate_threshold.
+        After open_seconds up to half_open_max_calls probe calls are let
+        through; a successful probe closes the circuit, a failed one reopens it.
+        """
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.rejected_calls = 0
+        self._calls = deque()  # (timestamp, failed, slow)
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Reserve a call slot, or raise CircuitOpenError if the call must not be made."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = HALF_OPEN
+                self._probes_in_flight = 0
+                logger.info(f"Circuit for {self.name} is half-open, probing OpenAI")
+            if self.state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_max_calls:
+                    self.rejected_calls += 1
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._probes_in_flight += 1
+
+    def record_success(self, elapsed_ms):
+        """Record a completed call and its latency."""
+        slow = elapsed_ms >= self.slow_call_ms
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if slow:
+                    self._open(f"probe took {elapsed_ms:.0f}ms")
+                    return
+                self.state = CLOSED
+                self._calls.clear()
+                logger.info(f"Circuit for {self.name} closed after a successful probe")
+                return
+            self._record(failed=False, slow=slow)
+
+    def record_failure(self, elapsed_ms):
+        """Record a failed call."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._open("probe failed")
+                return
+            self._record(failed=True, slow=elapsed_ms >= self.slow_call_ms)
+
+    def release(self):
+        """Give back a reserved slot without recording an outcome.
+
+        For calls that were cancelled or abandoned before OpenAI answered, so
+        a half-open probe slot is not held forever.
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _record(self, failed, slow):
+        now = time.monotonic()
+        self._calls.append((now, failed, slow))
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+        if self.state != CLOSED or len(self._calls) < self.min_calls:
+            return
+        total = len(self._calls)
+        error_rate = sum(1 for _, f, _ in self._calls if f) / total
+        slow_rate = sum(1 for _, _, s in self._calls if s) / total
+        if error_rate >= self.error_rate_threshold:
+            self._open(f"error rate {error_rate:.0%} over {total} calls")
+        elif slow_rate >= self.slow_rate_threshold:
+            self._open(f"slow call rate {slow_rate:.0%} over {total} calls")
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._calls.clear()
+        logger.warning(f"Circuit for {self.name} opened ({reason}); "
+                       f"using local feedback for {self.open_seconds}s")
+
+    def stats(self):
+        """Return the breaker state and counters for monitoring."""
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_calls': len(self._calls),
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected_calls
+            }
+
+
+class CircuitBreakerRegistry:
+    """One circuit breaker per bot section, created on first use."""
+
+    def __init__(self, **breaker_options):
+        self.breaker_options = breaker_options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, section):
+        """Return the breaker for a section."""
+        with self._lock:
+            breaker = self._breakers.get(section)
+            if breaker is None:
+                breaker = CircuitBreaker(section, **self.breaker_options)
+                self._breakers[section] = breaker
+            return breaker
+
+    def stats(self):
+        """Return stats for every section that has made a call."""
+        with self._lock:
+            breakers = list(self._breakers.items())
+        return {section: breaker.stats() for section, breaker in breakers}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Read-only in-memory index of the learning content
+Loads vocabulary, grammar lessons, conversation topics and assessment
+questions from content_data.db once into per-level tuples with precomputed
+counts and id maps. The index is never modified after it is built; when the
+content database changes, ContentManager builds a new one and swaps the
+reference, so readers always see one consistent snapshot.
+"""
+
+import time
+import logging
+from types import MappingProxyType
+from prompt_budget import summarize_grammar_rule
+from word_bitmap import WordBitmap
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze(groups):
+    """Turn {key: [rows]} into a read-only {key: (rows,)} mapping."""
+    return MappingProxyType({key: tuple(rows) for key, rows in groups.items()})
+
+
+class ContentIndex:
+    """Immutable snapshot of content_data.db."""
+
+    def __init__(self, vocabulary, lessons, topics, questions, data_version=None):
+        """Rows are dicts in database order; use ContentIndex.load to read them from SQLite."""
+        vocabulary_by_level = {}
+        definitions_by_level = {}
+        vocabulary_by_word = {}
+        for row in vocabulary:
+            vocabulary_by_level.setdefault(row['level'], []).append(row)
+            vocabulary_by_word.setdefault(row['word'], row)
+            level_definitions = definitions_by_level.setdefault(row['level'], {})
+            level_definitions.setdefault(row['definition'], None)
+        self.vocabulary = _freeze(vocabulary_by_level)
+        self.vocabulary_by_word = MappingProxyType(vocabulary_by_word)
+        self.vocabulary_by_id = MappingProxyType({row['id']: row for row in vocabulary})
+        # Word IDs of each level, to intersect with users' studied/tested bitmaps
+        self.level_bitmaps = MappingProxyType({
+            level: WordBitmap.from_ids(row['id'] for row in rows) for level, rows in vocabulary_by_level.items()
+        })
+        # Distinct definitions per level, in table order, for quiz distractors
+        self.definitions = _freeze({level: list(defs) for level, defs in definitions_by_level.items()})
+
+        lessons_by_level = {}
+        for row in lessons:
+            lessons_by_level.setdefault(row['level'], []).append(row)
+        self.lessons = _freeze(lessons_by_level)
+        self.lessons_by_id = MappingProxyType({row['topic_id']: row for row in lessons})
+
+        topics_by_level = {}
+        for row in topics:
+            topics_by_level.setdefault(row['level'], []).append(row)
+        self.topics = _freeze(topics_by_level)
+
+        self.questions = tuple(questions)
+
+        self.vocabulary_counts = MappingProxyType({level: len(rows) for level, rows in self.vocabulary.items()})
+        self.lesson_counts = MappingProxyType({level: len(rows) for level, rows in self.lessons.items()})
+        self.topic_counts = MappingProxyType({level: len(rows) for level, rows in self.topics.items()})
+
+        self.data_version = data_version
+        self.built_at = time.time()
+
+    @classmethod
+    def load(cls, conn, data_version=None):
+        """Read all content tables with one query each."""
+        vocabulary = [
+            {'id': row[0], 'word': row[1], 'definition': row[2], 'example': row[3], 'level': row[4]}
+            for row in conn.execute(
+                "SELECT id, word, definition, example, level FROM vocabulary_words ORDER BY id"
+            )
+        ]
+        lessons = [
+            {'title': row[1], 'content': row[2], 'level': row[3], 'topic_id': row[0],
+             'rule_summary': row[4] or summarize_grammar_rule(row[2] or "")}
+            for row in conn.execute(
+                "SELECT id, title, content, level, rule_summary FROM grammar_lessons ORDER BY id"
+            )
+        ]
+        topics = [
+            {'title': row[0], 'description': row[1], 'starter': row[2], 'level': row[3], 'topic_id': row[4]}
+            for row in conn.execute(
+                "SELECT title, description, starter, level, topic_id FROM conversation_topics ORDER BY topic_id"
+            )
+        ]
+        questions = [
+            {'question': row[0], 'options': tuple(row[1].split('|')), 'answer': row[2], 'level': row[3]}
+            for row in conn.execute(
+                "SELECT question, options, answer, level FROM assessment_questions ORDER BY id"
+            )
+        ]
+        index = cls(vocabulary, lessons, topics, questions, data_version=data_version)
+        logger.info(f"Content index built: {index.stats()}")
+        return index
+
+    def stats(self):
+        """Return row counts for logging."""
+        return {
+            'vocabulary': sum(self.vocabulary_counts.values()),
+            'lessons': sum(self.lesson_counts.values()),
+            'topics': sum(self.topic_counts.values()),
+            'questions': len(self.questions),
+            'data_version': self.data_version
+        }
@@ -1,80 +1,94 @@
 import sqlite3
 import random
 import os
+import time
+import bisect
+import hashlib
 from datetime import datetime
+from prompt_budget import summarize_grammar_rule
+from content_index import ContentIndex
+from word_bitmap import WordBitmap
+from db_connection import get_manager, executemany_chunked
+from db_migrations import migrate, CONTENT_DB_MIGRATIONS
 # Vocabulary is now defined directly in the database methods
 
+def vocab_rank(seed, word_id):
+    """Position of a word in a user's shuffled vocabulary order.
+
+    A keyed hash rather than a stored shuffle: the order is the same after
+    restarts, and words added later slot into it without moving the others.
+    """
+    digest = hashlib.blake2b(f"{seed}:{word_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') >> 1  # fits a signed SQLite INTEGER
+
 class ContentManager:
     """Manage educational content for the English learning bot."""
     
-    def __init__(self, db_path="content_data.db", user_db_path="user_data.db"):
-        """Initialize ContentManager with database connection."""
-        # Create database directory if it doesn't exist
-        db_dir = os.path.dirname(db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-            
+    def __init__(self, db_path="content_data.db", user_db_path="user_data.db", index_check_interval=30):
+        """Initialize ContentManager with database connection.
+
+        Content is served from an in-memory ContentIndex; every
+        index_check_interval seconds the content database is checked for
+        changes made by other processes and the index is rebuilt if needed.
+        """
         # Connect to database
-        self.conn = sqlite3.connect(db_path)
+        self.conn = get_manager(db_path).writer
         self.cursor = self.conn.cursor()
         
-        # Connect to user database for tracking studied words
-        self.user_conn = sqlite3.connect(user_db_path)
+        # Share UserDatabase's write connection for tracking studied words
+        self.user_conn = get_manager(user_db_path).writer
         self.user_cursor = self.user_conn.cursor()
+        # Optional DBWriter for user-table writes made inside content lookups
+        self.writer = None
         
-        # Initialize database
+        # Initialize database; duplicates are removed by the unique-keys migration
         self.init_database()
-        self.run_content_deduplication_report()
+        
+        # Build the in-memory content index
+        self.index_check_interval = index_check_interval
+        self._index = ContentIndex([], [], [], [])
+        self._permutations = {}  # (level, seed) -> (index, ranks, rows)
+        self.reload_index()
+        self.apply_content_id_remaps()
+        if self.has_missing_word_ids():
+            self.migrate_word_ids()
+    
+    def reload_index(self):
+        """Build a new content index from the database and swap it in."""
+        try:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            self._index = ContentIndex.load(self.conn, data_version=data_version)
+        except Exception as e:
+            print(f"Error building content index: {e}")
+        self._index_checked = time.monotonic()
+    
+    def read_view(self, user_conn):
+        """Return a ContentReadView for a worker thread that reads user tables
+        through user_conn (a read-only connection) and serves content from
+        this manager's index.
+        """
+        return ContentReadView(self, user_conn)
+
+    @property
+    def index(self):
+        """The current content index, rebuilt when the content database has changed."""
+        if time.monotonic() - self._index_checked >= self.index_check_interval:
+            self._index_checked = time.monotonic()
+            try:
+                # data_version only moves when another connection commits
+                data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+                if data_version != self._index.data_version:
+                    print("Content database changed, rebuilding content index")
+                    self.reload_index()
+            except Exception as e:
+                print(f"Error checking content database version: {e}")
+        return self._index
     
     def init_database(self):
-        """Initialize the database with required tables."""
+        """Bring the schema up to date and seed content; skipped when the schema is current."""
         try:
-            # Create vocabulary words table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vocabulary_words (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                word TEXT,
-                definition TEXT,
-                example TEXT,
-                level TEXT
-            )
-            ''')
-            
-            # Create grammar lessons table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS grammar_lessons (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT,
-                content TEXT,
-                level TEXT
-            )
-            ''')
-            
-            # Create assessment questions table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS assessment_questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                question TEXT,
-                options TEXT,
-                answer TEXT,
-                level TEXT,
-                type TEXT
-            )
-            ''')
-            
-            # Create conversation topics table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_topics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT,
-                description TEXT,
-                starter TEXT,
-                level TEXT,
-                topic_id INTEGER
-            )
-            ''')
-            
-            self.conn.commit()
+            if not migrate(self.conn, CONTENT_DB_MIGRATIONS, "content_data.db"):
+                return
             
             # Check if vocabulary table has data
             self.cursor.execute("SELECT COUNT(*) FROM vocabulary_words")
@@ -86,65 +100,64 @@ class ContentManager:
                 self.populate_grammar_lessons()
                 self.populate_assessment_questions()
                 self.populate_conversation_topics()
+            
+            self.populate_rule_summaries()
         
         except Exception as e:
             print(f"Error initializing content database: {e}")
     
+    def populate_rule_summaries(self):
+        """Compute the compact grading-prompt summary for lessons that do not have one yet."""
+        try:
+            self.cursor.execute("SELECT id, content FROM grammar_lessons WHERE rule_summary IS NULL")
+            rows = self.cursor.fetchall()
+            if not rows:
+                return
+            self.cursor.executemany(
+                "UPDATE grammar_lessons SET rule_summary = ? WHERE id = ?",
+                [(summarize_grammar_rule(content or ""), lesson_id) for lesson_id, content in rows]
+            )
+            self.conn.commit()
+            print(f"Computed rule summaries for {len(rows)} grammar lessons")
+        except Exception as e:
+            print(f"Error computing grammar rule summaries: {e}")
+    
     def get_vocabulary_for_level(self, level, count=5, user_id=None):
         """Get vocabulary words for a specific level, excluding already studied words."""
         try:
-            # Get studied words for this user if user_id provided
-            studied_words = set()
             if user_id:
-                studied_words = self.get_studied_words(user_id)
-            
-            # First try from database - exclude studied words
-            if studied_words:
-                placeholders = ','.join('?' * len(studied_words))
-                query = f"""
-                    SELECT word, definition, example 
-                    FROM vocabulary_words 
-                    WHERE level = ? AND word NOT IN ({placeholders})
-                    ORDER BY RANDOM() LIMIT ?
-                """
-                params = [level] + list(studied_words) + [count]
+                # Next unseen words in the user's own shuffled order
+                words = self.get_next_vocabulary(user_id, level, count)
             else:
-                query = "SELECT word, definition, example FROM vocabulary_words WHERE level = ? ORDER BY RANDOM() LIMIT ?"
-                params = [level, count]
-                
-            self.cursor.execute(query, params)
-            words = []
-            for row in self.cursor.fetchall():
-                words.append({
-                    'word': row[0],
-                    'definition': row[1],
-                    'example': row[2]
-                })
+                pool = self.index.vocabulary.get(level, ())
+                words = [
+                    {'word': w['word'], 'definition': w['definition'], 'example': w['example']}
+                    for w in random.sample(pool, min(count, len(pool)))
+                ]
             
             # If not enough words in database, use fallback (excluding studied words)
             if len(words) < count:
                 fallback_words = self.get_fallback_vocabulary(level, count * 2)  # Get more to filter
                 
-                # Filter out studied words from fallback
+                # Filter out studied and already picked words from fallback
                 if user_id:
+                    studied_words = self.get_studied_among(user_id, [w['word'] for w in fallback_words])
                     fallback_words = [w for w in fallback_words if w['word'] not in studied_words]
+                picked = {w['word'] for w in words}
+                fallback_words = [w for w in fallback_words if w['word'] not in picked]
                 
                 # Take only what we need
                 needed_count = count - len(words)
                 words.extend(fallback_words[:needed_count])
                 
-                # Try to save new fallback words to database for future use
-                for word in fallback_words[:needed_count]:
-                    try:
-                        self.cursor.execute(
-                            "INSERT INTO vocabulary_words (word, definition, example, level) VALUES (?, ?, ?, ?)",
-                            (word['word'], word['definition'], word['example'], level)
-                        )
-                    except Exception:
-                        # Word might already exist, ignore
-                        pass
-                
-                self.conn.commit()
+                # Save new fallback words to database for future use; existing words are skipped
+                if fallback_words[:needed_count]:
+                    executemany_chunked(
+                        self.conn,
+                        "INSERT OR IGNORE INTO vocabulary_words (word, definition, example, level) VALUES (?, ?, ?, ?)",
+                        [(w['word'], w['definition'], w['example'], level) for w in fallback_words[:needed_count]]
+                    )
+                    self.reload_index()
                 
             return words
         except Exception as e:
@@ -162,19 +175,8 @@ class ContentManager:
             # Check which lessons the user has already completed
             completed_lessons = self.get_completed_grammar_lessons(user_id, level)
             
-            # First try to get lessons from database
-            self.cursor.execute(
-                "SELECT id, title, content, level FROM grammar_lessons WHERE level = ? ORDER BY id",
-                (level,)
-            )
-            db_lessons = []
-            for row in self.cursor.fetchall():
-                db_lessons.append({
-                    'title': row[1],
-                    'content': row[2],
-                    'level': row[3],
-                    'topic_id': row[0]  # Use database ID as topic_id for consistency
-                })
+            # First try lessons from the content index (database ID is the topic_id)
+            db_lessons = self.index.lessons.get(level, ())
             
             # If database has lessons, use them
             if db_lessons:
@@ -186,7 +188,7 @@ class ContentManager:
             # Find the first uncompleted lesson
             for lesson in all_lessons:
                 if lesson['topic_id'] not in completed_lessons:
-                    return lesson
+                    return dict(lesson)
             
             # If all lessons are completed, return None to indicate completion
             return None
@@ -208,7 +210,7 @@ class ContentManager:
             print(f"Error getting completed grammar lessons: {e}")
             return []
     
-    def mark_grammar_lesson_completed(self, user_id, level, topic_id, score):
+    def mark_grammar_lesson_completed(self, user_id, level, topic_id, score, commit=True):
         """Mark a grammar lesson as completed for a user with their score."""
         try:
             # Check if already exists
@@ -231,9 +233,13 @@ class ContentManager:
                     (user_id, level, topic_id, score, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
                 )
             
-            self.user_conn.commit()
+            if commit:
+                self.user_conn.commit()
             return True
         except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
             print(f"Error marking grammar lesson completed: {e}")
             return False
     
@@ -269,7 +275,7 @@ class ContentManager:
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.user_cursor.execute(
-                "INSERT INTO user_grammar (user_id, lesson_title, level, date) VALUES (?, ?, ?, ?)",
+                "INSERT INTO user_grammar (user_id, lesson_title, level, completed_at) VALUES (?, ?, ?, ?)",
                 (user_id, lesson_title, level, now)
             )
             self.user_conn.commit()
@@ -287,14 +293,236 @@ class ContentManager:
         except Exception as e:
             print(f"Error resetting grammar seen for user {user_id}: {e}")
 
-    def get_studied_words(self, user_id):
-        """Get a set of words a user has already studied."""
+    def build_vocab_test(self, user_id, level, count=20, choices=4):
+        """Build a whole multiple-choice vocabulary test up front.
+
+        Uses one query for the user's most recently studied words; definitions
+        and the level's distractor pool come from the content index. Returns a list of
+        [word, options, correct_index]; words without a definition are skipped.
+        """
         try:
+            self.user_cursor.execute("""
+                SELECT word FROM vocabulary
+                WHERE user_id = ?
+                GROUP BY word
+                ORDER BY MAX(last_practiced) DESC
+                LIMIT ?
+            """, (user_id, count))
+            words = [row[0] for row in self.user_cursor.fetchall()]
+            if not words:
+                return []
+
+            index = self.index
+            pool = index.definitions.get(level, ())
+
+            questions = []
+            for word in words:
+                row = index.vocabulary_by_word.get(word)
+                correct = row['definition'] if row else None
+                if not correct:
+                    continue
+                distractors = [definition for definition in pool if definition != correct]
+                options = random.sample(distractors, min(choices - 1, len(distractors))) + [correct]
+                random.shuffle(options)
+                questions.append([word, options, options.index(correct)])
+            return questions
+        except Exception as e:
+            print(f"Error building vocabulary test for user {user_id}: {e}")
+            return []
+
+    def _permutation(self, level, seed):
+        """Return (ranks, rows) of the level's words in the order given by seed."""
+        index = self.index
+        cached = self._permutations.get((level, seed))
+        if cached and cached[0] is index:
+            return cached[1], cached[2]
+        ranked = sorted((vocab_rank(seed, row['id']), row) for row in index.vocabulary.get(level, ()))
+        ranks = [rank for rank, _ in ranked]
+        rows = [row for _, row in ranked]
+        if len(self._permutations) >= 1024:
+            self._permutations.clear()
+        self._permutations[(level, seed)] = (index, ranks, rows)
+        return ranks, rows
+    
+    def get_vocab_cursor(self, user_id, level, commit=True):
+        """Return (seed, position) of the user's vocabulary cursor, creating it on first use."""
+        self.user_cursor.execute(
+            "SELECT seed, position FROM vocab_cursor WHERE user_id = ? AND level = ?",
+            (user_id, level)
+        )
+        row = self.user_cursor.fetchone()
+        if row:
+            return row
+        seed = random.getrandbits(31)
+        self.user_cursor.execute(
+            "INSERT OR IGNORE INTO vocab_cursor (user_id, level, seed, position) VALUES (?, ?, ?, -1)",
+            (user_id, level, seed)
+        )
+        if commit:
+            self.user_conn.commit()
+        return seed, -1
+    
+    def get_next_vocabulary(self, user_id, level, count=5):
+        """Get the next `count` unstudied words after the user's cursor.
+
+        Only the candidate words are checked against the user's history, so
+        the cost does not grow with how many words the user has studied.
+        """
+        seed, position = self.get_vocab_cursor(user_id, level)
+        ranks, rows = self._permutation(level, seed)
+        i = bisect.bisect_right(ranks, position)
+        words = []
+        while len(words) < count and i < len(rows):
+            batch = rows[i:i + count * 2]
+            i += len(batch)
+            # Words studied before the cursor existed, or served twice
+            studied = self.get_studied_among(user_id, [w['word'] for w in batch])
+            for w in batch:
+                if w['word'] not in studied and len(words) < count:
+                    words.append({'word': w['word'], 'definition': w['definition'], 'example': w['example']})
+        return words
+    
+    def advance_vocab_cursor(self, user_id, word, commit=True):
+        """Move the user's cursor past a word they have just studied."""
+        try:
+            row = self.index.vocabulary_by_word.get(word)
+            if not row:
+                return
+            seed, _ = self.get_vocab_cursor(user_id, row['level'], commit=False)
             self.user_cursor.execute(
-                "SELECT word FROM vocabulary WHERE user_id = ?",
-                (user_id,)
+                "UPDATE vocab_cursor SET position = MAX(position, ?) WHERE user_id = ? AND level = ?",
+                (vocab_rank(seed, row['id']), user_id, row['level'])
             )
-            return set(row[0] for row in self.user_cursor.fetchall())
+            if commit:
+                self.user_conn.commit()
+        except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
+            print(f"Error advancing vocabulary cursor for user {user_id}: {e}")
+    
+    def get_word_id(self, word):
+        """Return the vocabulary_words ID of a word, or None if it is not in the content DB."""
+        row = self.index.vocabulary_by_word.get(word)
+        return row['id'] if row else None
+    
+    def get_word_bitmap(self, user_id, kind):
+        """Load a user's 'studied' or 'tested' WordBitmap from the user database."""
+        self.user_cursor.execute(
+            "SELECT bitmap FROM user_word_bitmaps WHERE user_id = ? AND kind = ?",
+            (user_id, kind)
+        )
+        row = self.user_cursor.fetchone()
+        return WordBitmap.from_bytes(row[0] if row else None)
+    
+    def get_studied_among(self, user_id, words):
+        """Return which of `words` the user has already studied."""
+        if not words:
+            return set()
+        studied = self.get_word_bitmap(user_id, 'studied')
+        return {word for word in words if self.get_word_id(word) in studied}
+    
+    def get_next_untested_words(self, user_id, level, batch_size=20):
+        """Get the next batch of studied but untested words for a user and level."""
+        try:
+            index = self.index
+            untested = (self.get_word_bitmap(user_id, 'studied') - self.get_word_bitmap(user_id, 'tested')) \
+                & index.level_bitmaps.get(level, WordBitmap())
+            words = []
+            for word_id in untested.ids():
+                if len(words) >= batch_size:
+                    break
+                row = index.vocabulary_by_id[word_id]
+                words.append({'word': row['word'], 'definition': row['definition']})
+            return words
+        except Exception as e:
+            print(f"Error getting untested words: {e}")
+            return []
+    
+    def apply_content_id_remaps(self):
+        """Repoint user rows at the ids kept when duplicate content was removed.
+
+        The unique-keys migration records every deleted word and grammar
+        lesson id in content_id_remap. Entries are cleared only after the user
+        database has committed, and re-applying them is a no-op.
+        """
+        try:
+            self.cursor.execute("SELECT kind, old_id, new_id FROM content_id_remap")
+            remaps = self.cursor.fetchall()
+        except sqlite3.OperationalError:
+            return
+        if not remaps:
+            return
+        try:
+            words = [(new_id, old_id) for kind, old_id, new_id in remaps if kind == 'word']
+            lessons = [(new_id, old_id) for kind, old_id, new_id in remaps if kind == 'grammar']
+            affected = set()
+            for table, kind in (('vocabulary', 'studied'), ('vocab_tested', 'tested')):
+                for _, old_id in words:
+                    self.user_cursor.execute(f"SELECT DISTINCT user_id FROM {table} WHERE word_id = ?", (old_id,))
+                    affected.update((row[0], table, kind) for row in self.user_cursor.fetchall())
+                self.user_cursor.executemany(f"UPDATE {table} SET word_id = ? WHERE word_id = ?", words)
+            self.user_cursor.executemany("UPDATE user_grammar SET topic_id = ? WHERE topic_id = ?", lessons)
+            self.rebuild_word_bitmaps(affected)
+            self.user_conn.commit()
+            self.cursor.execute("DELETE FROM content_id_remap")
+            self.conn.commit()
+            print(f"Repointed user progress for {len(remaps)} removed duplicate content rows")
+        except Exception as e:
+            self.user_conn.rollback()
+            print(f"Error repointing user progress to deduplicated content: {e}")
+    
+    def has_missing_word_ids(self):
+        """True if user rows still lack a word_id (old rows or bulk imports); one indexed lookup."""
+        try:
+            for table in ('vocabulary', 'vocab_tested'):
+                self.user_cursor.execute(f"SELECT 1 FROM {table} WHERE word_id IS NULL LIMIT 1")
+                if self.user_cursor.fetchone():
+                    return True
+        except Exception as e:
+            print(f"Error checking for missing word IDs: {e}")
+        return False
+    
+    def migrate_word_ids(self):
+        """Backfill word_id on old vocabulary/vocab_tested rows and rebuild the users' bitmaps."""
+        try:
+            affected = set()
+            for table, kind in (('vocabulary', 'studied'), ('vocab_tested', 'tested')):
+                self.user_cursor.execute(f"SELECT DISTINCT user_id, word FROM {table} WHERE word_id IS NULL")
+                rows = [(self.get_word_id(word), user_id, word) for user_id, word in self.user_cursor.fetchall()]
+                rows = [row for row in rows if row[0] is not None]
+                if rows:
+                    self.user_cursor.executemany(
+                        f"UPDATE {table} SET word_id = ? WHERE user_id = ? AND word = ? AND word_id IS NULL", rows
+                    )
+                    affected.update((user_id, table, kind) for _, user_id, _ in rows)
+            self.rebuild_word_bitmaps(affected)
+            self.user_conn.commit()
+            if affected:
+                print(f"Migrated word IDs and bitmaps for {len(affected)} user word sets")
+        except Exception as e:
+            print(f"Error migrating word IDs: {e}")
+    
+    def rebuild_word_bitmaps(self, affected):
+        """Recompute the bitmaps for (user_id, table, kind) sets from their rows; the caller commits."""
+        for user_id, table, kind in affected:
+            self.user_cursor.execute(
+                f"SELECT DISTINCT word_id FROM {table} WHERE user_id = ? AND word_id IS NOT NULL", (user_id,)
+            )
+            bitmap = WordBitmap.from_ids(row[0] for row in self.user_cursor.fetchall())
+            self.user_cursor.execute('''
+                INSERT INTO user_word_bitmaps (user_id, kind, bitmap, word_count) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id, kind) DO UPDATE SET
+                    bitmap = excluded.bitmap,
+                    word_count = excluded.word_count
+            ''', (user_id, kind, bitmap.to_bytes(), len(bitmap)))
+    
+    def get_studied_words(self, user_id):
+        """Get a set of words a user has already studied."""
+        try:
+            by_id = self.index.vocabulary_by_id
+            studied = self.get_word_bitmap(user_id, 'studied')
+            return {by_id[word_id]['word'] for word_id in studied.ids() if word_id in by_id}
         except Exception as e:
             print(f"Error getting studied words for user {user_id}: {e}")
             return set()
@@ -471,51 +699,16 @@ class ContentManager:
             return lessons.get(level, lessons['beginner'])
         return random.choice(lessons.get(level, lessons['beginner']))
     
-    def populate_assessment_questions(self):
-        """Populate assessment_questions table with initial data."""
-        try:
-            # Get assessment questions from fallback
-            questions = self.get_fallback_assessment_questions(200) # Get more to ensure variety
-            
-            # Insert questions into database, avoiding duplicates
-            for q in questions:
-                options_str = '|'.join(q['options'])
-                
-                # Check if a similar question already exists
-                self.cursor.execute(
-                    "SELECT COUNT(*) FROM assessment_questions WHERE question = ? AND level = ?",
-                    (q['question'], q['level'])
-                )
-                if self.cursor.fetchone()[0] == 0: # Only insert if not exists
-                    self.cursor.execute(
-                        "INSERT INTO assessment_questions (question, options, answer, level, type) VALUES (?, ?, ?, ?, ?)",
-                        (q['question'], options_str, q['answer'], q['level'], 'multiple_choice')
-                    )
-            
-            self.conn.commit()
-            print(f"Populated assessment questions table with unique questions.")
-        except Exception as e:
-            print(f"Error populating assessment questions table: {e}")
-    
-    
     def get_mixed_assessment_questions(self, total_count=20):
         """Get a mix of assessment questions across different levels and types."""
         try:
             questions = []
             levels = ['beginner', 'amateur', 'intermediate', 'advanced']
             
-            # Fetch all questions from the database first
-            self.cursor.execute(
-                "SELECT question, options, answer, level FROM assessment_questions ORDER BY id"
-            )
-            all_db_questions = []
-            for row in self.cursor.fetchall():
-                all_db_questions.append({
-                    'question': row[0],
-                    'options': row[1].split('|'),
-                    'answer': row[2],
-                    'level': row[3]
-                })
+            # Copy all questions from the content index first
+            all_db_questions = [
+                {**q, 'options': list(q['options'])} for q in self.index.questions
+            ]
 
             # If no questions in DB, use only fallback
             if not all_db_questions:
@@ -617,19 +810,13 @@ class ContentManager:
                     word_data['level'] = level
                     all_vocabulary.append(word_data)
             
-            # Insert words into database
-            for word_data in all_vocabulary:
-                    try:
-                        self.cursor.execute(
-                            "INSERT INTO vocabulary_words (word, definition, example, level) VALUES (?, ?, ?, ?)",
-                        (word_data['word'], word_data['definition'], word_data['example'], word_data['level'])
-                        )
-                    except sqlite3.IntegrityError:
-                        # Word might already exist, skip it
-                        continue
-            
-            self.conn.commit()
-            print(f"Populated vocabulary table with {len(all_vocabulary)} words for all levels")
+            # Insert words into database; words already present (in any level) are skipped
+            inserted = executemany_chunked(
+                self.conn,
+                "INSERT OR IGNORE INTO vocabulary_words (word, definition, example, level) VALUES (?, ?, ?, ?)",
+                ((w['word'], w['definition'], w['example'], w['level']) for w in all_vocabulary)
+            )
+            print(f"Populated vocabulary table with {inserted} words for all levels")
         except Exception as e:
             print(f"Error populating vocabulary table: {e}")    
     
@@ -639,20 +826,15 @@ class ContentManager:
             # Get all grammar lessons for each level
             levels = ['beginner', 'amateur', 'intermediate', 'advanced']
             
-            for level in levels:
-                lessons = self.get_fallback_grammar_lesson(level, all_lessons=True)
-                
-                for lesson in lessons:
-                    try:
-                        self.cursor.execute(
-                "INSERT INTO grammar_lessons (title, content, level) VALUES (?, ?, ?)",
-                            (lesson['title'], lesson['content'], level)
-                        )
-                    except Exception:
-                        # Lesson might already exist, skip it
-                        continue
-            
-            self.conn.commit()
+            executemany_chunked(
+                self.conn,
+                "INSERT OR IGNORE INTO grammar_lessons (title, content, level) VALUES (?, ?, ?)",
+                (
+                    (lesson['title'], lesson['content'], level)
+                    for level in levels
+                    for lesson in self.get_fallback_grammar_lesson(level, all_lessons=True)
+                )
+            )
             print(f"Populated grammar lessons table with lessons for all levels")
         except Exception as e:
             print(f"Error populating grammar lessons table: {e}")
@@ -664,23 +846,13 @@ class ContentManager:
             # Get assessment questions from fallback
             questions = self.get_fallback_assessment_questions(200) # Get more to ensure variety
             
-            # Insert questions into database, avoiding duplicates
-            for q in questions:
-                options_str = '|'.join(q['options'])
-                
-                # Check if a similar question already exists
-                self.cursor.execute(
-                    "SELECT COUNT(*) FROM assessment_questions WHERE question = ? AND level = ?",
-                    (q['question'], q['level'])
-                )
-                if self.cursor.fetchone()[0] == 0: # Only insert if not exists
-                    self.cursor.execute(
-                        "INSERT INTO assessment_questions (question, options, answer, level, type) VALUES (?, ?, ?, ?, ?)",
-                        (q['question'], options_str, q['answer'], q['level'], 'multiple_choice')
-                    )
-            
-            self.conn.commit()
-            print(f"Populated assessment questions table with unique questions.")
+            # The unique (question, level) index skips questions already present
+            inserted = executemany_chunked(
+                self.conn,
+                "INSERT OR IGNORE INTO assessment_questions (question, options, answer, level, type) VALUES (?, ?, ?, ?, ?)",
+                ((q['question'], '|'.join(q['options']), q['answer'], q['level'], 'multiple_choice') for q in questions)
+            )
+            print(f"Populated assessment questions table with {inserted} unique questions.")
         except Exception as e:
             print(f"Error populating assessment questions table: {e}")
     
@@ -690,22 +862,17 @@ class ContentManager:
         try:
             levels = ['beginner', 'amateur', 'intermediate', 'advanced']
             
-            for level in levels:
-                # Use the internal method to get all static topics for the level
-                level_topics = self._get_static_conversation_topics(level)
-                
-                for topic in level_topics:
-                    if isinstance(topic, dict):
-                        try:
-                            self.cursor.execute(
-                                "INSERT INTO conversation_topics (title, description, starter, level, topic_id) VALUES (?, ?, ?, ?, ?)",
-                                (topic['title'], topic['description'], topic['starter'], topic['level'], topic['topic_id'])
-                            )
-                        except sqlite3.IntegrityError:
-                            # Topic might already exist, skip it
-                            continue
-            
-            self.conn.commit()
+            executemany_chunked(
+                self.conn,
+                "INSERT OR IGNORE INTO conversation_topics (title, description, starter, level, topic_id) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (topic['title'], topic['description'], topic['starter'], topic['level'], topic['topic_id'])
+                    for level in levels
+                    # Use the internal method to get all static topics for the level
+                    for topic in self._get_static_conversation_topics(level)
+                    if isinstance(topic, dict)
+                )
+            )
             print(f"Populated conversation topics table with topics for all levels")
         except Exception as e:
             print(f"Error populating conversation topics table: {e}")
@@ -714,20 +881,8 @@ class ContentManager:
     def get_fallback_conversation_topics(self, user_id, level):
         """Get conversation topics for a specific level, first from database then fallback."""
         try:
-            # First try to get topics from database
-            self.cursor.execute(
-                "SELECT title, description, starter, level, topic_id FROM conversation_topics WHERE level = ? ORDER BY topic_id",
-                (level,)
-            )
-            db_topics = []
-            for row in self.cursor.fetchall():
-                db_topics.append({
-                    'title': row[0],
-                    'description': row[1],
-                    'starter': row[2],
-                    'level': row[3],
-                    'topic_id': row[4]
-                })
+            # First try topics from the content index
+            db_topics = self.index.topics.get(level, ())
             
             # If database has topics, use them
             if db_topics:
@@ -740,7 +895,7 @@ class ContentManager:
             
             # If no user_id provided, just return a random topic
             if user_id is None:
-                selected_topic = random.choice(all_topics)
+                selected_topic = dict(random.choice(all_topics))
                 print(f"Random topic selected for level {level}: {selected_topic['title']}")
                 return selected_topic
                 
@@ -755,8 +910,11 @@ class ContentManager:
                 self.reset_conversation_seen(user_id, level)
                 available = all_topics
             
-            selected_topic = random.choice(available)
-            self.add_conversation_seen(user_id, selected_topic['topic_id'], level)
+            selected_topic = dict(random.choice(available))
+            if self.writer:
+                self.writer.submit(self.add_conversation_seen, user_id, selected_topic['topic_id'], level)
+            else:
+                self.add_conversation_seen(user_id, selected_topic['topic_id'], level)
             print(f"Selected topic for user {user_id}: {selected_topic['title']}")
             return selected_topic
             
@@ -934,7 +1092,7 @@ class ContentManager:
             print(f"Error getting seen conversation topics for user {user_id}: {e}")
             return set()
     
-    def add_conversation_seen(self, user_id, topic_id, level):
+    def add_conversation_seen(self, user_id, topic_id, level, commit=True):
         """Mark a conversation topic as seen by a user."""
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -942,8 +1100,12 @@ class ContentManager:
                 "INSERT INTO user_conversation (user_id, topic_id, level, seen_at) VALUES (?, ?, ?, ?)",
                 (user_id, topic_id, level, now)
             )
-            self.user_conn.commit()
+            if commit:
+                self.user_conn.commit()
         except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
             print(f"Error adding conversation seen for user {user_id}: {e}")
     
     def reset_conversation_seen(self, user_id, level):
@@ -961,8 +1123,7 @@ class ContentManager:
     def get_total_vocabulary_count(self, level):
         """Get total number of vocabulary words for a level."""
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM vocabulary_words WHERE level = ?", (level,))
-            count = self.cursor.fetchone()[0]
+            count = self.index.vocabulary_counts.get(level, 0)
             if count == 0:
                 # Fallback
                 return len(self.get_fallback_vocabulary(level, 200))
@@ -976,9 +1137,8 @@ class ContentManager:
     def get_total_grammar_count(self, level):
         """Get total number of grammar lessons for a level."""
         try:
-            # First, try to get the count from the database
-            self.cursor.execute("SELECT COUNT(*) FROM grammar_lessons WHERE level = ?", (level,))
-            count = self.cursor.fetchone()[0]
+            # First, try the precomputed count from the content index
+            count = self.index.lesson_counts.get(level, 0)
             if count > 0:
                 return count
             
@@ -994,9 +1154,8 @@ class ContentManager:
     def get_total_conversation_count(self, level):
         """Get total number of conversation topics for a level."""
         try:
-            # First, try to get the count from the database
-            self.cursor.execute("SELECT COUNT(*) FROM conversation_topics WHERE level = ?", (level,))
-            count = self.cursor.fetchone()[0]
+            # First, try the precomputed count from the content index
+            count = self.index.topic_counts.get(level, 0)
             if count > 0:
                 return count
             
@@ -1006,194 +1165,35 @@ class ContentManager:
         except Exception as e:
             print(f"Error getting conversation count for level {level}: {e}")
             return 5 # Fallback to a default of 5 if everything fails
-    
-    def check_duplicate_vocabulary(self):
-        """Check for duplicate vocabulary words across all levels in the database."""
-        self.cursor.execute("SELECT word, level FROM vocabulary_words")
-        all_db_words = self.cursor.fetchall()
 
-        all_words_map = {}
-        for word_text, level in all_db_words:
-            normalized_word = word_text.lower()
-            if normalized_word not in all_words_map:
-                all_words_map[normalized_word] = []
-            all_words_map[normalized_word].append(level)
-        
-        return {w: lvls for w, lvls in all_words_map.items() if len(lvls) > 1}
-
-    def check_duplicate_grammar(self):
-        """Check for duplicate grammar lesson titles across all levels in the database."""
-        self.cursor.execute("SELECT title, level FROM grammar_lessons")
-        all_db_lessons = self.cursor.fetchall()
-
-        all_titles_map = {}
-        for title_text, level in all_db_lessons:
-            normalized_title = title_text.strip().lower()
-            if normalized_title not in all_titles_map:
-                all_titles_map[normalized_title] = []
-            all_titles_map[normalized_title].append(level)
-        
-        return {t: lvls for t, lvls in all_titles_map.items() if len(lvls) > 1}
-
-    def check_duplicate_conversation(self):
-        """Check for duplicate conversation topics across all levels in the database."""
-        self.cursor.execute("SELECT title, level FROM conversation_topics")
-        all_db_topics = self.cursor.fetchall()
-
-        all_titles_map = {}
-        for title_text, level in all_db_topics:
-            normalized_title = title_text.strip().lower()
-            if normalized_title not in all_titles_map:
-                all_titles_map[normalized_title] = []
-            all_titles_map[normalized_title].append(level)
-        
-        return {t: lvls for t, lvls in all_titles_map.items() if len(lvls) > 1}
+class ContentReadView:
+    """Read-only content access for worker threads (see ContentManager.read_view).
 
+    Not a ContentManager: only the read methods listed below are shared, so
+    nothing that writes can be called on the read-only connection by mistake.
+    """
 
-    def remove_duplicate_vocabulary(self):
-        """Remove duplicate vocabulary words, keeping the word in the lowest level from the database."""
-        try:
-            # Get all words from the database, ordered by level priority (beginner, amateur, intermediate, advanced)
-            # and then by ID to keep the earliest entry in case of same level duplicates
-            self.cursor.execute("""
-                SELECT word, level, id FROM vocabulary_words 
-                ORDER BY 
-                    CASE level
-                        WHEN 'beginner' THEN 1
-                        WHEN 'amateur' THEN 2
-                        WHEN 'intermediate' THEN 3
-                        WHEN 'advanced' THEN 4
-                        ELSE 5
-                    END,
-                    id ASC
-            """)
-            all_db_words = self.cursor.fetchall()
+    def __init__(self, manager, user_conn):
+        self.manager = manager
+        self.user_conn = user_conn
+        self.user_cursor = user_conn.cursor()
 
-            seen_words = set()
-            words_to_delete_ids = []
+    @property
+    def index(self):
+        # The owning manager checks for content changes on the event loop thread
+        return self.manager._index
 
-            for word_text, level, word_id in all_db_words:
-                normalized_word = word_text.lower()
-                if normalized_word in seen_words:
-                    words_to_delete_ids.append(word_id)
-                else:
-                    seen_words.add(normalized_word)
-            
-            if words_to_delete_ids:
-                # Delete duplicate words from the database
-                placeholders = ','.join('?' * len(words_to_delete_ids))
-                self.cursor.execute(f"DELETE FROM vocabulary_words WHERE id IN ({placeholders})", words_to_delete_ids)
-                self.conn.commit()
-                print(f"Removed {len(words_to_delete_ids)} duplicate vocabulary words from the database.")
-            else:
-                print("No duplicate vocabulary words found in the database to remove.")
-
-        except Exception as e:
-            print(f"Error removing duplicate vocabulary from DB: {e}")
-    
-    def remove_duplicate_grammar(self):
-        """Remove duplicate grammar lessons, keeping the lesson in the lowest level from the database."""
-        try:
-            # Get all lessons from the database, ordered by level priority
-            self.cursor.execute("""
-                SELECT title, level, id FROM grammar_lessons 
-                ORDER BY 
-                    CASE level
-                        WHEN 'beginner' THEN 1
-                        WHEN 'amateur' THEN 2
-                        WHEN 'intermediate' THEN 3
-                        WHEN 'advanced' THEN 4
-                        ELSE 5
-                    END,
-                    id ASC
-            """)
-            all_db_lessons = self.cursor.fetchall()
-
-            seen_titles = set()
-            lessons_to_delete_ids = []
-
-            for title_text, level, lesson_id in all_db_lessons:
-                normalized_title = title_text.strip().lower()
-                if normalized_title in seen_titles:
-                    lessons_to_delete_ids.append(lesson_id)
-                else:
-                    seen_titles.add(normalized_title)
-            
-            if lessons_to_delete_ids:
-                # Delete duplicate lessons from the database
-                placeholders = ','.join('?' * len(lessons_to_delete_ids))
-                self.cursor.execute(f"DELETE FROM grammar_lessons WHERE id IN ({placeholders})", lessons_to_delete_ids)
-                self.conn.commit()
-                print(f"Removed {len(lessons_to_delete_ids)} duplicate grammar lessons from the database.")
-            else:
-                print("No duplicate grammar lessons found in the database to remove.")
-
-        except Exception as e:
-            print(f"Error removing duplicate grammar from DB: {e}")
-    
-    def remove_duplicate_conversation(self):
-        """Remove duplicate conversation topics, keeping the topic in the lowest level from the database."""
-        try:
-            # Get all topics from the database, ordered by level priority
-            self.cursor.execute("""
-                SELECT title, level, id FROM conversation_topics 
-                ORDER BY 
-                    CASE level
-                        WHEN 'beginner' THEN 1
-                        WHEN 'amateur' THEN 2
-                        WHEN 'intermediate' THEN 3
-                        WHEN 'advanced' THEN 4
-                        ELSE 5
-                    END,
-                    id ASC
-            """)
-            all_db_topics = self.cursor.fetchall()
-
-            seen_titles = set()
-            topics_to_delete_ids = []
-
-            for title_text, level, topic_id in all_db_topics:
-                normalized_title = title_text.strip().lower()
-                if normalized_title in seen_titles:
-                    topics_to_delete_ids.append(topic_id)
-                else:
-                    seen_titles.add(normalized_title)
-            
-            if topics_to_delete_ids:
-                # Delete duplicate topics from the database
-                placeholders = ','.join('?' * len(topics_to_delete_ids))
-                self.cursor.execute(f"DELETE FROM conversation_topics WHERE id IN ({placeholders})", topics_to_delete_ids)
-                self.conn.commit()
-                print(f"Removed {len(topics_to_delete_ids)} duplicate conversation topics from the database.")
-            else:
-                print("No duplicate conversation topics found in the database to remove.")
-
-        except Exception as e:
-            print(f"Error removing duplicate conversation from DB: {e}")
-    
-    def run_content_deduplication_report(self):
-        """Check and remove duplicates, print a report."""
-        vocab_dupes = self.check_duplicate_vocabulary()
-        grammar_dupes = self.check_duplicate_grammar()
-        conv_dupes = self.check_duplicate_conversation()
-        if vocab_dupes:
-            print("[DEDUP] Duplicate vocabulary words found:")
-            for w, lvls in vocab_dupes.items():
-                print(f"  {w}: {lvls}")
-            self.remove_duplicate_vocabulary()
-        else:
-            print("[DEDUP] No duplicate vocabulary words.")
-        if grammar_dupes:
-            print("[DEDUP] Duplicate grammar lesson titles found:")
-            for t, lvls in grammar_dupes.items():
-                print(f"  {t}: {lvls}")
-            self.remove_duplicate_grammar()
-        else:
-            print("[DEDUP] No duplicate grammar lessons.")
-        if conv_dupes:
-            print("[DEDUP] Duplicate conversation topics found:")
-            for t, lvls in conv_dupes.items():
-                print(f"  {t}: {lvls}")
-            self.remove_duplicate_conversation()
-        else:
-            print("[DEDUP] No duplicate conversation topics.")
\ No newline at end of file
+    # These only use self.index and self.user_cursor
+    build_vocab_test = ContentManager.build_vocab_test
+    get_grammar_lesson_for_level = ContentManager.get_grammar_lesson_for_level
+    get_completed_grammar_lessons = ContentManager.get_completed_grammar_lessons
+    get_grammar_progress = ContentManager.get_grammar_progress
+    get_word_id = ContentManager.get_word_id
+    get_word_bitmap = ContentManager.get_word_bitmap
+    get_studied_among = ContentManager.get_studied_among
+    get_studied_words = ContentManager.get_studied_words
+    get_next_untested_words = ContentManager.get_next_untested_words
+    get_total_grammar_count = ContentManager.get_total_grammar_count
+    get_total_conversation_count = ContentManager.get_total_conversation_count
+    get_fallback_grammar_lesson = ContentManager.get_fallback_grammar_lesson
+    _get_static_conversation_topics = ContentManager._get_static_conversation_topics
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Shared SQLite connection management
+Every module opens its databases through here so they all run in WAL mode
+with the same busy timeout and cache settings. Each database file gets one
+ConnectionManager with a single write connection and a small pool of
+read-only connections, so the admin panel and analytics can read while the
+bot writes instead of failing with "database is locked".
+"""
+
+import os
+import queue
+import sqlite3
+import logging
+import threading
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Per-connection tuning. cache_size is negative KiB, mmap_size is bytes.
+PROFILES = {
+    'default': {'cache_size': -8000, 'mmap_size': 64 * 1024 * 1024},
+    'analytics': {'cache_size': -64000, 'mmap_size': 256 * 1024 * 1024},
+    'small': {'cache_size': -2000, 'mmap_size': 0},
+}
+BUSY_TIMEOUT_MS = 10000
+DEFAULT_READ_POOL_SIZE = 4
+# Rows per executemany call (and per transaction) for bulk writes
+BULK_CHUNK_SIZE = 1000
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    Still a real sqlite3.Connection, so pandas and code that ends with
+    conn.close() work unchanged.
+    """
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+
+def configure(conn, profile='default', read_only=False):
+    """Apply the journal mode and tuning PRAGMAs to a connection."""
+    settings = PROFILES.get(profile, PROFILES['default'])
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if read_only:
+        conn.execute("PRAGMA query_only = ON")
+    else:
+        # WAL is a property of the database file; readers pick it up from there
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = {settings['cache_size']}")
+    conn.execute(f"PRAGMA mmap_size = {settings['mmap_size']}")
+    return conn
+
+
+def chunked(rows, size=BULK_CHUNK_SIZE):
+    """Yield lists of up to size items from any iterable, consuming it lazily."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def executemany_chunked(conn, sql, rows, chunk_size=BULK_CHUNK_SIZE, commit=True):
+    """Run sql for every row with one executemany per chunk; returns rows changed.
+
+    rows may be a generator, so large imports are never held in memory. Each
+    chunk is committed on its own unless commit is False, in which case the
+    caller owns the transaction.
+    """
+    changed = 0
+    for chunk in chunked(rows, chunk_size):
+        changed += conn.executemany(sql, chunk).rowcount
+        if commit:
+            conn.commit()
+    return changed
+
+
+def connect(db_path, profile='default', read_only=False, factory=sqlite3.Connection):
+    """Open a standalone, configured connection (for scripts and one-off tools)."""
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, factory=factory)
+    return configure(conn, profile, read_only)
+
+
+class ConnectionManager:
+    """One write connection and a pool of read-only connections for a database file.
+
+    The pool keeps up to read_pool_size idle readers open for reuse. Borrowing
+    never blocks; extra readers are opened on demand and closed when given
+    back to a full pool. A reader that is never given back is closed when it
+    is garbage collected.
+    """
+
+    def __init__(self, db_path, profile='default', read_pool_size=DEFAULT_READ_POOL_SIZE):
+        self.db_path = db_path
+        self.profile = profile
+        self.read_pool_size = read_pool_size
+        self.write_lock = threading.RLock()
+        self._writer = None
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    @property
+    def writer(self):
+        """The database's single write connection, opened on first use."""
+        with self._lock:
+            if self._writer is None:
+                self._writer = connect(self.db_path, self.profile)
+            return self._writer
+
+    def acquire_read(self):
+        """Borrow a read-only connection; call close() on it to give it back."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        self.writer  # make sure the file exists and is in WAL mode
+        conn = connect(self.db_path, self.profile, read_only=True, factory=PooledConnection)
+        conn.pool = self
+        return conn
+
+    def release(self, conn):
+        """Return a borrowed read connection to the pool, closing it if the pool is full."""
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.read_pool_size:
+            self._idle.put(conn)
+        else:
+            sqlite3.Connection.close(conn)
+
+    def close(self):
+        """Close the write connection and all idle read connections."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                sqlite3.Connection.close(conn)
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path, profile='default', read_pool_size=DEFAULT_READ_POOL_SIZE):
+    """Return the process-wide ConnectionManager for db_path, creating it if needed.
+
+    The first caller's profile and pool size win for a given file.
+    """
+    key = os.path.abspath(db_path)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = _managers[key] = ConnectionManager(db_path, profile, read_pool_size)
+        return manager
+
+
+def close_all():
+    """Close every managed connection (on shutdown)."""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.close()
+        _managers.clear()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for user_data.db and content_data.db
+Each database records the migrations it has applied in a schema_version
+table. On startup only the steps newer than the stored version run, each in
+its own transaction; a database that is already current costs one query.
+Steps are written to be safe on databases created by the old
+CREATE TABLE IF NOT EXISTS code, which may already have some of the changes.
+"""
+
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def add_column_if_missing(conn, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+# --- user_data.db -----------------------------------------------------------
+
+def _user_baseline(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        level TEXT DEFAULT 'beginner',
+        join_date TEXT,
+        last_active TEXT,
+        assessment_done BOOLEAN DEFAULT FALSE
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS progress (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        section TEXT,
+        level TEXT,
+        score REAL DEFAULT 0,
+        date TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vocabulary (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        word TEXT,
+        score INTEGER DEFAULT 0,
+        last_practiced TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_grammar (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        level TEXT,
+        topic_id INTEGER,
+        score INTEGER DEFAULT 0,
+        completed_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_conversation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        topic_id INTEGER,
+        level TEXT,
+        seen_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_user_conversation_user_level
+    ON user_conversation (user_id, level)
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vocab_tested (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        word TEXT,
+        tested_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )
+    ''')
+
+
+def _user_notifications(conn):
+    add_column_if_missing(conn, 'users', 'notifications', 'INTEGER DEFAULT 1')
+
+
+def _user_vocab_cursor(conn):
+    # Per-user, per-level position in the user's shuffled vocabulary order
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vocab_cursor (
+        user_id INTEGER,
+        level TEXT,
+        seed INTEGER,
+        position INTEGER DEFAULT -1,
+        PRIMARY KEY (user_id, level)
+    )
+    ''')
+
+
+def _user_word_ids(conn):
+    # word_id values are backfilled by ContentManager.migrate_word_ids,
+    # which can see vocabulary_words
+    add_column_if_missing(conn, 'vocabulary', 'word_id', 'INTEGER')
+    add_column_if_missing(conn, 'vocab_tested', 'word_id', 'INTEGER')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_word_bitmaps (
+        user_id INTEGER,
+        kind TEXT,
+        bitmap BLOB,
+        word_count INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, kind)
+    )
+    ''')
+
+
+def _user_grammar_titles(conn):
+    # add_grammar_seen/get_seen_grammar_titles track lessons by title
+    add_column_if_missing(conn, 'user_grammar', 'lesson_title', 'TEXT')
+
+
+def _user_hot_query_indexes(conn):
+    # Latest-by-date lookups in the progress history, e.g. recent assessments
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_progress_user_section_level_date
+    ON progress (user_id, section, level, date)
+    ''')
+    # Recently studied words for tests and per-word lookups
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocabulary_user_word
+    ON vocabulary (user_id, word)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocab_tested_user_word
+    ON vocab_tested (user_id, word)
+    ''')
+    # Completed grammar lessons per user and level
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_user_grammar_user_level
+    ON user_grammar (user_id, level, topic_id)
+    ''')
+    # Word IDs still to backfill
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocabulary_missing_word_id
+    ON vocabulary (word_id) WHERE word_id IS NULL
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocab_tested_missing_word_id
+    ON vocab_tested (word_id) WHERE word_id IS NULL
+    ''')
+
+
+def _user_progress_current(conn):
+    # Latest score per (user, section, level). progress stays the append-only
+    # history; the trigger keeps this table in step inside the same transaction
+    # as every progress insert, whoever makes it.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS progress_current (
+        user_id INTEGER,
+        section TEXT,
+        level TEXT,
+        score REAL DEFAULT 0,
+        updated_at TEXT,
+        PRIMARY KEY (user_id, section, level)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_progress_current
+    AFTER INSERT ON progress
+    BEGIN
+        INSERT INTO progress_current (user_id, section, level, score, updated_at)
+        VALUES (NEW.user_id, NEW.section, NEW.level, NEW.score, NEW.date)
+        ON CONFLICT (user_id, section, level) DO UPDATE SET
+            score = excluded.score,
+            updated_at = excluded.updated_at
+        WHERE progress_current.updated_at IS NULL OR excluded.updated_at >= progress_current.updated_at;
+    END
+    ''')
+    # Backfill from history: later rows overwrite earlier ones
+    conn.execute('''
+    INSERT INTO progress_current (user_id, section, level, score, updated_at)
+    SELECT user_id, section, level, score, date FROM progress WHERE true ORDER BY date, id
+    ON CONFLICT (user_id, section, level) DO UPDATE SET
+        score = excluded.score,
+        updated_at = excluded.updated_at
+    ''')
+
+
+USER_DB_MIGRATIONS = [
+    (1, "baseline tables", _user_baseline),
+    (2, "users.notifications", _user_notifications),
+    (3, "vocab_cursor table", _user_vocab_cursor),
+    (4, "word_id columns and user_word_bitmaps", _user_word_ids),
+    (5, "user_grammar.lesson_title", _user_grammar_titles),
+    (6, "indexes for hot queries", _user_hot_query_indexes),
+    (7, "progress_current table", _user_progress_current),
+]
+
+
+# --- content_data.db --------------------------------------------------------
+
+def _content_baseline(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS vocabulary_words (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        word TEXT,
+        definition TEXT,
+        example TEXT,
+        level TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS grammar_lessons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        content TEXT,
+        level TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS assessment_questions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        question TEXT,
+        options TEXT,
+        answer TEXT,
+        level TEXT,
+        type TEXT
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS conversation_topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT,
+        description TEXT,
+        starter TEXT,
+        level TEXT,
+        topic_id INTEGER
+    )
+    ''')
+
+
+def _content_rule_summary(conn):
+    add_column_if_missing(conn, 'grammar_lessons', 'rule_summary', 'TEXT')
+
+
+def _content_indexes(conn):
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocabulary_words_level
+    ON vocabulary_words (level)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_vocabulary_words_word
+    ON vocabulary_words (word)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_grammar_lessons_level
+    ON grammar_lessons (level, id)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_conversation_topics_level
+    ON conversation_topics (level, topic_id)
+    ''')
+
+
+_LEVEL_ORDER = """
+    CASE level
+        WHEN 'beginner' THEN 1
+        WHEN 'amateur' THEN 2
+        WHEN 'intermediate' THEN 3
+        WHEN 'advanced' THEN 4
+        ELSE 5
+    END"""
+
+
+def _delete_duplicates(conn, table, key, remap_kind=None):
+    # Keep the row in the lowest level, then the oldest. With remap_kind the
+    # deleted ids are recorded in content_id_remap next to the id that was
+    # kept, so ContentManager can repoint user rows that reference them.
+    if remap_kind:
+        conn.execute(f'''
+        INSERT OR REPLACE INTO content_id_remap (kind, old_id, new_id)
+        SELECT ?, id, kept_id FROM (
+            SELECT id,
+                   FIRST_VALUE(id) OVER (PARTITION BY {key} ORDER BY {_LEVEL_ORDER}, id) AS kept_id
+            FROM {table}
+        ) WHERE id != kept_id
+        ''', (remap_kind,))
+    conn.execute(f'''
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY {key} ORDER BY {_LEVEL_ORDER}, id) AS n
+            FROM {table}
+        ) WHERE n > 1
+    )
+    ''')
+
+
+def _content_unique_keys(conn):
+    # Seeding and fallback inserts use INSERT OR IGNORE against these.
+    # user_data.db refers to words (word_id, bitmaps) and grammar lessons
+    # (user_grammar.topic_id) by id; it is repointed from content_id_remap.
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS content_id_remap (
+        kind TEXT,
+        old_id INTEGER,
+        new_id INTEGER,
+        PRIMARY KEY (kind, old_id)
+    )
+    ''')
+    _delete_duplicates(conn, 'vocabulary_words', 'lower(word)', 'word')
+    _delete_duplicates(conn, 'grammar_lessons', 'lower(trim(title))', 'grammar')
+    _delete_duplicates(conn, 'assessment_questions', 'question, level')
+    _delete_duplicates(conn, 'conversation_topics', 'lower(trim(title))')
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_vocabulary_words_word
+    ON vocabulary_words (lower(word))
+    ''')
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_grammar_lessons_title
+    ON grammar_lessons (lower(trim(title)))
+    ''')
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_assessment_questions_question
+    ON assessment_questions (question, level)
+    ''')
+    conn.execute('''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_conversation_topics_title
+    ON conversation_topics (lower(trim(title)))
+    ''')
+
+
+def _content_recompute_rule_summaries(conn):
+    # Summaries used to drop quoted forms; ContentManager recomputes NULL ones
+    conn.execute("UPDATE grammar_lessons SET rule_summary = NULL")
+
+
+CONTENT_DB_MIGRATIONS = [
+    (1, "baseline tables", _content_baseline),
+    (2, "grammar_lessons.rule_summary", _content_rule_summary),
+    (3, "lookup indexes", _content_indexes),
+    (4, "unique content keys", _content_unique_keys),
+    (5, "recompute grammar rule summaries", _content_recompute_rule_summaries),
+]
+
+
+# --- runner -------------------------------------------------------------------
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)."""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    )
+    ''')
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn, migrations, name="database"):
+    """Apply the migrations newer than the stored schema version; returns how many ran.
+
+    Each step and its schema_version row commit together, so a failed step
+    leaves the database at the previous version and raises.
+    """
+    current = get_schema_version(conn)
+    pending = [step for step in migrations if step[0] > current]
+    if not pending:
+        return 0
+    if conn.in_transaction:
+        conn.commit()
+    for version, description, apply in pending:
+        try:
+            conn.execute("BEGIN")
+            apply(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({description}) of {name} failed", exc_info=True)
+            raise
+        logger.info(f"Applied migration {version} to {name}: {description}")
+    return len(pending)
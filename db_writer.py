@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Single-writer task with group commit for user_data.db
+Handlers hand their writes to DBWriter instead of running them and
+committing one by one. A single asyncio task drains the queue and applies
+everything that arrived within a few milliseconds in one transaction, so a
+burst of writes from many users costs one commit instead of one each.
+Callers that read their own write straight afterwards await it; the
+others fire and forget.
+"""
+
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class DBWriter:
+    """Apply queued write intents to one connection in grouped transactions."""
+
+    def __init__(self, conn, max_batch=100, max_delay_ms=5):
+        """conn is the database's write connection (see db_connection).
+
+        A group is committed once max_batch writes are pending or max_delay_ms
+        after its first write arrived, whichever comes first.
+        """
+        self.conn = conn
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue = None
+        self._task = None
+        self.writes = 0
+        self.commits = 0
+        self.errors = 0
+        self.max_commit_ms = 0.0
+
+    def start(self):
+        """Start the writer task on the running event loop."""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, commit=False, **kwargs); returns a future for its result.
+
+        fn is a write method that takes a commit flag, e.g.
+        UserDatabase.add_word_studied. The future resolves once the group the
+        write belongs to has committed. Without a running writer (scripts,
+        shutdown) the write runs and commits immediately.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self._task is None or self._task.done():
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        # Failures are logged in _apply; mark them retrieved so writes that
+        # nobody awaits do not also warn when the future is collected
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._queue.put_nowait((fn, args, kwargs, future))
+        return future
+
+    async def write(self, fn, *args, **kwargs):
+        """Queue a write and wait until it is committed; returns fn's result."""
+        return await self.submit(fn, *args, **kwargs)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._apply(batch)
+            if stopping:
+                return
+
+    def _apply(self, batch):
+        """Run a group of writes and commit them together.
+
+        Each write runs inside its own savepoint, so one that raises is rolled
+        back on its own and the rest of the group still commits.
+        """
+        started = time.perf_counter()
+        results = []
+        for fn, args, kwargs, future in batch:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+            self.conn.execute("SAVEPOINT db_writer_item")
+            try:
+                result = fn(*args, commit=False, **kwargs)
+            except Exception as e:
+                logger.error(f"Grouped write {getattr(fn, '__name__', fn)} failed: {e}")
+                self.errors += 1
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK TO db_writer_item")
+                    self.conn.execute("RELEASE db_writer_item")
+                results.append((future, None, e))
+                continue
+            # A write that flushed the write buffer has already committed
+            if self.conn.in_transaction:
+                self.conn.execute("RELEASE db_writer_item")
+            results.append((future, result, None))
+        try:
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Group commit of {len(batch)} writes failed, all were rolled back: {e}")
+            self.conn.rollback()
+            for fn, args, _, _ in batch:
+                logger.error(f"Lost grouped write {getattr(fn, '__name__', fn)}{args}")
+            self.errors += len(batch)
+            results = [(future, None, e) for future, _, _ in results]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.writes += len(batch)
+        self.commits += 1
+        self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+        for future, result, error in results:
+            if future.cancelled():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Commit everything still queued and stop the writer task."""
+        if self._task is None:
+            return
+        # Writes queued before the stop marker are applied first
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        # Anything submitted while stopping
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+        if batch:
+            self._apply(batch)
+
+    def stats(self):
+        """Return write and commit counters for monitoring."""
+        return {
+            'writes': self.writes,
+            'commits': self.commits,
+            'writes_per_commit': round(self.writes / self.commits, 1) if self.commits else 0,
+            'errors': self.errors,
+            'max_commit_ms': round(self.max_commit_ms, 1),
+            'pending': self._queue.qsize() if self._queue else 0
+        }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Structured JSON grading for vocabulary, grammar and conversation answers
+Asks the LLM for a JSON object with score, feedback and error spans, validates
+it and retries once on malformed output, instead of regex-parsing free text.
+"""
+
+import re
+import json
+import logging
+from prompt_budget import log_prompt_size
+
+logger = logging.getLogger(__name__)
+
+# Appended to every grading prompt. JSON mode requires the word "JSON" in the prompt.
+GRADING_FORMAT_INSTRUCTIONS = """Respond ONLY with a JSON object in this exact format:
+{"feedback": "<constructive feedback in Persian, at most 4 short sentences>",
+ "score": <integer from 0 to 100>,
+ "errors": [{"text": "<wrong part of the student's text>", "correction": "<corrected English>", "explanation": "<short Persian explanation>"}]}
+Use an empty list for "errors" if there are no mistakes. List at most 3 errors."""
+
+RETRY_INSTRUCTIONS = ("Your previous answer was not valid JSON in the required format. "
+                      "Reply again with ONLY the JSON object and keep the feedback short.")
+
+# Output budgets per section. Feedback is capped at a few sentences, so these
+# leave headroom for the JSON keys and up to three error spans.
+GRADING_MAX_TOKENS = {
+    'vocabulary': 350,
+    'grammar': 400,
+    'conversation': 400,
+}
+DEFAULT_MAX_TOKENS = 400
+MAX_ERRORS = 3
+
+_FEEDBACK_VALUE = re.compile(r'"feedback"\s*:\s*"((?:[^"\\]|\\.)*)', re.DOTALL)
+
+
+class GradingFormatError(ValueError):
+    """The LLM did not return a usable grading object."""
+
+
+def parse_grading(raw):
+    """Validate a raw JSON grading reply and return {'score', 'feedback', 'errors'}."""
+    try:
+        data = json.loads(raw)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise GradingFormatError(f"Grading is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise GradingFormatError("Grading is not a JSON object")
+
+    score = data.get('score')
+    if isinstance(score, str) and score.strip().isdigit():
+        score = int(score.strip())
+    if isinstance(score, float) and score.is_integer():
+        score = int(score)
+    if not isinstance(score, int) or isinstance(score, bool) or not 0 <= score <= 100:
+        raise GradingFormatError(f"Grading has an invalid score: {score!r}")
+
+    feedback = data.get('feedback')
+    if not isinstance(feedback, str) or not feedback.strip():
+        raise GradingFormatError("Grading has no feedback")
+
+    errors = []
+    for error in data.get('errors') or []:
+        if isinstance(error, dict) and isinstance(error.get('text'), str) and error['text'].strip():
+            errors.append({
+                'text': error['text'].strip(),
+                'correction': str(error.get('correction') or '').strip(),
+                'explanation': str(error.get('explanation') or '').strip()
+            })
+    return {'score': score, 'feedback': feedback.strip(), 'errors': errors[:MAX_ERRORS]}
+
+
+def format_feedback(grading):
+    """Render feedback and error spans as the message text shown to the learner."""
+    lines = [grading['feedback']]
+    if grading.get('errors'):
+        lines.append("")
+        lines.append("🔍 اشتباهات:")
+        for error in grading['errors']:
+            line = f"• {error['text']}"
+            if error['correction']:
+                line += f" ← {error['correction']}"
+            if error['explanation']:
+                line += f" ({error['explanation']})"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def partial_feedback(raw):
+    """Decode the feedback field of an incomplete JSON reply, as far as it has arrived."""
+    match = _FEEDBACK_VALUE.search(raw)
+    if not match:
+        return ""
+    value = match.group(1)
+    # Drop a trailing escape sequence that has not fully arrived yet
+    value = re.sub(r'\\u[0-9a-fA-F]{0,3}$', '', value)
+    trailing_backslashes = len(value) - len(value.rstrip('\\'))
+    if trailing_backslashes % 2:
+        value = value[:-1]
+    try:
+        return json.loads(f'"{value}"')
+    except json.JSONDecodeError:
+        return ""
+
+
+async def stream_feedback_field(chunks, raw_parts):
+    """Yield only the feedback text from a streamed JSON reply.
+
+    The full raw reply is collected into raw_parts so it can be validated once
+    the stream ends.
+    """
+    shown = ""
+    async for delta in chunks:
+        raw_parts.append(delta)
+        feedback = partial_feedback("".join(raw_parts))
+        if len(feedback) > len(shown) and feedback.startswith(shown):
+            yield feedback[len(shown):]
+            shown = feedback
+
+
+async def grade(llm_client, prompt, section, reply=None):
+    """Request a JSON grading, streaming its feedback into `reply` when given.
+
+    Malformed output is retried once without streaming; a second failure
+    raises GradingFormatError. CircuitOpenError from the client propagates.
+    """
+    options = {
+        'response_format': {"type": "json_object"},
+        'max_tokens': GRADING_MAX_TOKENS.get(section, DEFAULT_MAX_TOKENS)
+    }
+    log_prompt_size(prompt, section)
+    prompt = f"{prompt}\n\n{GRADING_FORMAT_INSTRUCTIONS}"
+
+    if reply is None:
+        raw = await llm_client.complete(prompt, section=section, **options)
+    else:
+        raw_parts = []
+        stream = llm_client.stream(prompt, section=section, **options)
+        try:
+            await reply.consume(stream_feedback_field(stream, raw_parts))
+        finally:
+            # Close the stream now if the reply failed midway, so the client's
+            # concurrency and circuit breaker slots are released promptly
+            await stream.aclose()
+        raw = "".join(raw_parts)
+
+    try:
+        return parse_grading(raw)
+    except GradingFormatError as e:
+        logger.warning(f"Malformed {section} grading, retrying once: {e}")
+
+    messages = [
+        {"role": "user", "content": prompt},
+        {"role": "assistant", "content": raw or ""},
+        {"role": "user", "content": RETRY_INSTRUCTIONS}
+    ]
+    raw = await llm_client.chat(messages, section=section, **options)
+    return parse_grading(raw)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Local intent router for messages sent outside of a practice task
+Answers greetings, thanks, help requests and mistyped menu buttons with
+canned Persian replies so only open-ended messages reach the LLM.
+"""
+
+import re
+import logging
+from difflib import SequenceMatcher
+
+logger = logging.getLogger(__name__)
+
+# Main menu and vocabulary navigation buttons, as sent by the reply keyboards
+MENU_BUTTONS = [
+    "📚 تمرین لغات",
+    "📝 درس گرامر",
+    "🗣️ تمرین مکالمه",
+    "📊 پیشرفت من",
+    "🧪 سنجش سطح",
+    "❓ راهنما",
+    "📚 ادامه تمرین با لغات جدید",
+    "🔄 بازگشت به منوی اصلی",
+]
+
+MENU_HINT = "لطفاً برای تمرین از دکمه‌های منو استفاده کنید: 📚 تمرین لغات، 📝 درس گرامر، 🗣️ تمرین مکالمه یا 🧪 سنجش سطح."
+
+# Keyword intents, checked in order. Keywords are matched against normalized text.
+INTENTS = [
+    {
+        'name': 'greeting',
+        'keywords': ['سلام', 'درود', 'صبح بخیر', 'عصر بخیر', 'شب بخیر', 'وقت بخیر', 'خوبی', 'حالت چطوره',
+                     'salam', 'hi', 'hello', 'hey', 'how are you', 'good morning', 'good evening', 'good afternoon'],
+        'reply': "سلام! 👋 خوشحالم که اینجا هستید. " + MENU_HINT
+    },
+    {
+        'name': 'thanks',
+        'keywords': ['مرسی', 'ممنون', 'ممنونم', 'متشکرم', 'سپاس', 'سپاسگزارم', 'دمت گرم', 'mersi', 'merci',
+                     'thanks', 'thank you', 'thx', 'tnx', 'ty'],
+        'reply': "خواهش می‌کنم! 🌟 به تمرین ادامه دهید. " + MENU_HINT
+    },
+    {
+        'name': 'goodbye',
+        'keywords': ['خداحافظ', 'خدافظ', 'بای', 'فعلا', 'bye', 'goodbye', 'see you'],
+        'reply': "خداحافظ! 👋 منتظر تمرین بعدی شما هستیم."
+    },
+    {
+        'name': 'help',
+        # Whole phrases only: a bare 'how' or 'چطور' also starts real questions
+        'keywords': ['کمک', 'راهنما', 'راهنمایی', 'چیکار کنم', 'چه کار کنم', 'چطور کار میکنه', 'چطور کار می‌کنه',
+                     'چجوری کار میکنه', 'چجوری کار می‌کنه', 'help', 'how does this work', 'how does it work',
+                     'how to use'],
+        'reply': "برای یادگیری، یکی از بخش‌ها را از منو انتخاب کنید:\n"
+                 "📚 تمرین لغات - یادگیری لغات جدید\n"
+                 "📝 درس گرامر - یادگیری قواعد گرامری\n"
+                 "🗣️ تمرین مکالمه - گفتگو به انگلیسی\n"
+                 "📊 پیشرفت من - مشاهده پیشرفت\n"
+                 "🧪 سنجش سطح - تعیین سطح زبان"
+    },
+    {
+        'name': 'menu',
+        'keywords': ['منو', 'منوی اصلی', 'شروع', 'بازگشت', 'menu', 'start', 'back'],
+        'reply': MENU_HINT
+    },
+]
+
+# Messages with more words than this are treated as open-ended
+MAX_INTENT_WORDS = 4
+
+
+def normalize_text(text):
+    """Lowercase, unify Arabic/Persian letters and drop emoji and punctuation."""
+    text = text.lower()
+    text = text.replace("ي", "ی").replace("ك", "ک").replace("‌", " ")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class IntentRouter:
+    """Keyword and fuzzy-match classifier for stray main-menu messages."""
+
+    def __init__(self, buttons=MENU_BUTTONS, intents=INTENTS, button_threshold=0.8):
+        self.buttons = {normalize_text(label): label for label in buttons}
+        self.button_threshold = button_threshold
+        self.keywords = []
+        for intent in intents:
+            for keyword in intent['keywords']:
+                self.keywords.append((normalize_text(keyword), intent))
+
+    def match_button(self, text):
+        """Return the menu button a (possibly mistyped) message refers to, or None."""
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+        if normalized in self.buttons:
+            return self.buttons[normalized]
+        best_label, best_ratio = None, 0.0
+        for key, label in self.buttons.items():
+            ratio = SequenceMatcher(None, normalized, key).ratio()
+            if ratio > best_ratio:
+                best_label, best_ratio = label, ratio
+        return best_label if best_ratio >= self.button_threshold else None
+
+    def route(self, text):
+        """Classify a message.
+
+        Returns {'intent', 'reply', 'button'} for recognized intents, where
+        button is set when the message is a mistyped menu button, or None if
+        the message is open-ended and should go to the LLM.
+        """
+        button = self.match_button(text)
+        if button:
+            return {'intent': 'button', 'reply': None, 'button': button}
+
+        normalized = normalize_text(text)
+        words = normalized.split()
+        if not words:
+            # Only emoji or punctuation
+            return {'intent': 'empty', 'reply': MENU_HINT, 'button': None}
+        if len(words) > MAX_INTENT_WORDS:
+            return None
+
+        padded = f" {normalized} "
+        for keyword, intent in self.keywords:
+            if f" {keyword} " in padded:
+                return {'intent': intent['name'], 'reply': intent['reply'], 'button': None}
+        return None
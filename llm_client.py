@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Async LLM client layer for the English learning bot
+Wraps AsyncOpenAI so Telegram handlers can await completions without
+blocking the event loop for every other user.
+"""
+
+import asyncio
+import time
+import logging
+from openai import AsyncOpenAI
+from circuit_breaker import CircuitBreakerRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+
+class LLMClient:
+    """Awaitable chat-completion client shared by all bot handlers."""
+
+    def __init__(self, api_key, model=DEFAULT_MODEL, max_concurrent_requests=200,
+                 timeout=30.0, max_retries=2, breaker_options=None):
+        """Create the underlying AsyncOpenAI client.
+
+        max_concurrent_requests caps how many completions are in flight at once
+        so a traffic spike queues locally instead of tripping OpenAI rate limits.
+        breaker_options are passed to the per-section circuit breakers; calls
+        for a section whose circuit is open raise CircuitOpenError immediately.
+        """
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+        self.model = model
+        self._semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.breakers = CircuitBreakerRegistry(**(breaker_options or {}))
+
+    async def complete(self, prompt, section='general', **kwargs):
+        """Send a single-user-message prompt and return the reply text."""
+        messages = [{"role": "user", "content": prompt}]
+        return await self.chat(messages, section=section, **kwargs)
+
+    async def chat(self, messages, section='general', model=None, **kwargs):
+        """Run a chat completion and return the content of the first choice."""
+        breaker = self.breakers.get(section)
+        async with self._semaphore:
+            # Reserve the breaker slot only once the call can actually start
+            breaker.before_call()
+            start_time = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=messages,
+                    **kwargs
+                )
+            except Exception as e:
+                elapsed_ms = (time.monotonic() - start_time) * 1000
+                breaker.record_failure(elapsed_ms)
+                logger.error(f"OpenAI call failed for {section} after {elapsed_ms:.0f}ms: {e}")
+                raise
+            except BaseException:
+                # Cancelled: free the slot without judging OpenAI
+                breaker.release()
+                raise
+            elapsed_ms = (time.monotonic() - start_time) * 1000
+            breaker.record_success(elapsed_ms)
+        usage = response.usage
+        if usage:
+            logger.info(f"OpenAI call successful for {section} in {elapsed_ms:.0f}ms "
+                        f"({usage.prompt_tokens} prompt + {usage.completion_tokens} completion tokens)")
+        else:
+            logger.info(f"OpenAI call successful for {section} in {elapsed_ms:.0f}ms")
+        return response.choices[0].message.content
+
+    async def stream(self, prompt, section='general', model=None, **kwargs):
+        """Stream a completion, yielding text deltas as they arrive."""
+        messages = [{"role": "user", "content": prompt}]
+        breaker = self.breakers.get(section)
+        first_token_ms = None
+        async with self._semaphore:
+            breaker.before_call()
+            start_time = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=messages,
+                    stream=True,
+                    **kwargs
+                )
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token_ms is None:
+                            first_token_ms = (time.monotonic() - start_time) * 1000
+                        yield delta
+            except Exception as e:
+                elapsed_ms = (time.monotonic() - start_time) * 1000
+                breaker.record_failure(elapsed_ms)
+                logger.error(f"OpenAI stream failed for {section} after {elapsed_ms:.0f}ms: {e}")
+                raise
+            except BaseException:
+                # Cancelled, or the consumer closed the generator early
+                breaker.release()
+                raise
+            elapsed_ms = (time.monotonic() - start_time) * 1000
+            # Long answers stream for a while, so judge latency by the first token
+            breaker.record_success(first_token_ms if first_token_ms is not None else elapsed_ms)
+        logger.info(f"OpenAI stream finished for {section} in {elapsed_ms:.0f}ms "
+                    f"(first token after {first_token_ms or 0:.0f}ms)")
+
+    async def close(self):
+        """Close the underlying HTTP connection pool."""
+        await self.client.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Prompt compaction and token budgeting for LLM grading
+Grammar lessons are condensed into short rule summaries for the grading
+prompt, and every section's prompt is kept inside an input token budget.
+"""
+
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Input token budgets per section for the grading prompt itself, not counting
+# the JSON format instructions the grader appends
+PROMPT_TOKEN_BUDGETS = {
+    'vocabulary': 350,
+    'grammar': 450,
+    'conversation': 450,
+}
+DEFAULT_PROMPT_BUDGET = 450
+
+# Rule summaries are computed once per lesson and stored in content_data.db
+RULE_SUMMARY_MAX_CHARS = 400
+
+
+def estimate_tokens(text):
+    """Rough token count: ~4 Latin characters per token, ~2 for Persian and other scripts."""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return (ascii_chars + 3) // 4 + (other_chars + 1) // 2
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text at a line or word boundary so it fits in max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.split("\n")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop()
+    text = "\n".join(lines)
+    words = text.split(" ")
+    while len(words) > 1 and estimate_tokens(" ".join(words) + " …") > max_tokens:
+        words.pop()
+    return " ".join(words) + " …"
+
+
+def summarize_grammar_rule(content, max_chars=RULE_SUMMARY_MAX_CHARS):
+    """Condense a grammar lesson into its usage points and forms.
+
+    The learner already sees the full lesson; the grader only needs what the
+    rule is and how it is formed, so "Examples:" sections are dropped. Quoted
+    text after a label is kept, since for lines like 'Negative: "There
+    isn't"' it is the form itself.
+    """
+    kept = []
+    in_examples = False
+    for line in content.split("\n"):
+        line = line.strip()
+        if not line:
+            continue
+        if line.rstrip(":").lower() in ("examples", "example"):
+            in_examples = True
+            continue
+        if line.endswith(":") and not line.startswith(("-", "•")) and not line[0].isdigit():
+            in_examples = False
+        if in_examples:
+            continue
+        line = re.sub(r'^(?:[-•]|\d+\.)\s*', '', line)
+        if line:
+            kept.append(line)
+
+    summary = "; ".join(kept).replace(":;", ":")
+    if len(summary) > max_chars:
+        summary = summary[:max_chars].rsplit(" ", 1)[0].rstrip(";,") + " …"
+    return summary
+
+
+def render_with_budget(template, section, elastic_field, **fields):
+    """Fill template, shrinking fields[elastic_field] so the prompt fits the section budget."""
+    budget = PROMPT_TOKEN_BUDGETS.get(section, DEFAULT_PROMPT_BUDGET)
+    fixed_tokens = estimate_tokens(template.format(**{**fields, elastic_field: ""}))
+    room = max(budget - fixed_tokens, 50)
+    fields[elastic_field] = truncate_to_tokens(fields[elastic_field], room)
+    return template.format(**fields)
+
+
+def log_prompt_size(prompt, section):
+    """Log the estimated prompt size and warn when a section exceeds its budget."""
+    tokens = estimate_tokens(prompt)
+    budget = PROMPT_TOKEN_BUDGETS.get(section, DEFAULT_PROMPT_BUDGET)
+    if tokens > budget:
+        logger.warning(f"Prompt for {section} is ~{tokens} tokens, over its budget of {budget}")
+    else:
+        logger.info(f"Prompt for {section}: ~{tokens} tokens (budget {budget})")
+    return tokens
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Persistent exact-match cache for LLM grading responses
+Learners often submit the same sentence for the same word or lesson; cached
+feedback and scores are returned without another OpenAI round trip.
+"""
+
+import re
+import time
+import hashlib
+import logging
+import threading
+from db_connection import get_manager
+
+logger = logging.getLogger(__name__)
+
+
+# Bumped whenever normalize_answer changes, so entries keyed the old way are never hit
+KEY_VERSION = 2
+
+
+def normalize_answer(text):
+    """Normalize an answer so trivially different submissions share a key.
+
+    Only whitespace and quote styles are unified. Case and punctuation are
+    part of what the grader judges, so they stay in the key.
+    """
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class GradingCache:
+    """SQLite-backed grading cache with TTL expiry and LRU eviction."""
+
+    def __init__(self, db_path="grading_cache.db", ttl_seconds=30 * 24 * 3600,
+                 max_entries=50000, touch_interval=300):
+        """Open (or create) the cache database.
+
+        Entries older than ttl_seconds are treated as misses; once the cache
+        holds more than max_entries rows the least recently used ones are
+        evicted. last_used is refreshed at most every touch_interval seconds
+        per entry to keep hits from turning into writes.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_evict = 0
+        self._lock = threading.Lock()
+
+        self.manager = get_manager(db_path, profile='small')
+        self.conn = self.manager.writer
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS grading_cache (
+            cache_key TEXT PRIMARY KEY,
+            feedback TEXT,
+            score INTEGER,
+            created_at REAL,
+            last_used REAL,
+            hits INTEGER DEFAULT 0
+        )
+        ''')
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_grading_cache_last_used
+        ON grading_cache (last_used)
+        ''')
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(template_version, item_id, answer):
+        """Build the cache key for (prompt template version, word/lesson id, answer)."""
+        raw = f"{KEY_VERSION}\x1f{template_version}\x1f{item_id}\x1f{normalize_answer(answer)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, template_version, item_id, answer):
+        """Return {'feedback', 'score'} for a cached grading, or None on a miss."""
+        key = self.make_key(template_version, item_id, answer)
+        now = time.time()
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT feedback, score, created_at, last_used FROM grading_cache WHERE cache_key = ?",
+                    (key,)
+                ).fetchone()
+                if row is None or now - row[2] > self.ttl_seconds:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                if now - row[3] > self.touch_interval:
+                    self.conn.execute(
+                        "UPDATE grading_cache SET last_used = ?, hits = hits + 1 WHERE cache_key = ?",
+                        (now, key)
+                    )
+                    self.conn.commit()
+            return {'feedback': row[0], 'score': row[1]}
+        except Exception as e:
+            logger.error(f"Error reading grading cache: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, template_version, item_id, answer, feedback, score):
+        """Store a grading result, evicting old entries when the cache is full."""
+        key = self.make_key(template_version, item_id, answer)
+        now = time.time()
+        try:
+            with self._lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO grading_cache (cache_key, feedback, score, created_at, last_used, hits) "
+                    "VALUES (?, ?, ?, ?, ?, 0)",
+                    (key, feedback, score, now, now)
+                )
+                self._puts_since_evict += 1
+                # Checking the size on every insert is wasteful, do it in batches
+                if self._puts_since_evict >= 100:
+                    self._evict(now)
+                self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error writing grading cache: {e}")
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        self._puts_since_evict = 0
+        self.conn.execute("DELETE FROM grading_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self.conn.execute("SELECT COUNT(*) FROM grading_cache").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM grading_cache WHERE cache_key IN ("
+                "SELECT cache_key FROM grading_cache ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            logger.info(f"Evicted {count - self.max_entries} least recently used grading cache entries")
+
+    def stats(self):
+        """Return hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate_percent': (self.hits / total) * 100 if total else 0
+        }
+
+    def close(self):
+        """Close the cache database."""
+        self.manager.close()
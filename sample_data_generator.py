@@ -4,7 +4,8 @@ Sample Data Generator for English Learning Telegram Bot
 Generates realistic test data for demonstration and thesis purposes
 """
 
-import sqlite3
+from db_connection import connect, executemany_chunked
+from user_db import UserDatabase
 import random
 import json
 from datetime import datetime, timedelta
@@ -305,50 +306,44 @@ class SampleDataGenerator:
         progress_data = self.generate_progress_data(users)
         grammar_data = self.generate_grammar_data(users)
         
-        # Insert into database
-        conn = sqlite3.connect(self.user_db_path)
-        cursor = conn.cursor()
+        # Insert into database in chunked batches; UserDatabase also brings
+        # the schema up to date first
+        db = UserDatabase(self.user_db_path)
+        conn = db.conn
         
         try:
             # Insert users
-            for user in users:
-                cursor.execute("""
-                    INSERT OR REPLACE INTO users 
-                    (user_id, username, level, join_date, last_active, assessment_done)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    user['user_id'], user['username'], user['level'],
-                    user['join_date'], user['last_active'], user['assessment_done']
-                ))
+            executemany_chunked(conn, """
+                INSERT OR REPLACE INTO users 
+                (user_id, username, level, join_date, last_active, assessment_done)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                (user['user_id'], user['username'], user['level'],
+                 user['join_date'], user['last_active'], user['assessment_done'])
+                for user in users
+            ))
             
-            # Insert vocabulary data
-            for vocab in vocabulary_data:
-                cursor.execute("""
-                    INSERT INTO vocabulary (user_id, word, score, last_practiced)
-                    VALUES (?, ?, ?, ?)
-                """, (vocab['user_id'], vocab['word'], vocab['score'], vocab['last_practiced']))
+            # Insert vocabulary data (word IDs are backfilled when the bot starts)
+            db.add_words_studied_bulk(
+                (vocab['user_id'], vocab['word'], vocab['score'], None, vocab['last_practiced'])
+                for vocab in vocabulary_data
+            )
             
             # Insert progress data
-            for progress in progress_data:
-                cursor.execute("""
-                    INSERT INTO progress (user_id, section, level, score, date)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    progress['user_id'], progress['section'], progress['level'],
-                    progress['score'], progress['date']
-                ))
+            db.import_progress_rows(
+                (progress['user_id'], progress['section'], progress['level'], progress['score'], progress['date'])
+                for progress in progress_data
+            )
             
             # Insert grammar data
-            for grammar in grammar_data:
-                cursor.execute("""
-                    INSERT INTO user_grammar (user_id, level, topic_id, score, completed_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    grammar['user_id'], grammar['level'], grammar['topic_id'],
-                    grammar['score'], grammar['completed_at']
-                ))
-            
-            conn.commit()
+            executemany_chunked(conn, """
+                INSERT INTO user_grammar (user_id, level, topic_id, score, completed_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                (grammar['user_id'], grammar['level'], grammar['topic_id'],
+                 grammar['score'], grammar['completed_at'])
+                for grammar in grammar_data
+            ))
             
             print("✅ Sample data inserted successfully!")
             print(f"   👥 Users: {len(users)}")
@@ -367,15 +362,12 @@ class SampleDataGenerator:
             print(f"❌ Error inserting sample data: {e}")
             conn.rollback()
             return None
-        
-        finally:
-            conn.close()
     
     def export_sample_data(self, filename="sample_dataset.json"):
         """Export generated data as JSON for analysis."""
         print("📤 Exporting sample dataset...")
         
-        conn = sqlite3.connect(self.user_db_path)
+        conn = connect(self.user_db_path)
         
         # Fetch all data
         users_df = pd.read_sql_query("SELECT * FROM users WHERE user_id >= 1000", conn)
@@ -420,7 +412,7 @@ class SampleDataGenerator:
     
     def generate_summary_report(self):
         """Generate a summary report of the sample data."""
-        conn = sqlite3.connect(self.user_db_path)
+        conn = connect(self.user_db_path)
         
         # Basic statistics
         stats = {
@@ -4,7 +4,7 @@ Simple Dataset Generator for English Learning Telegram Bot
 Creates basic test data without external dependencies
 """
 
-import sqlite3
+from db_connection import connect
 import random
 import json
 from datetime import datetime, timedelta
@@ -147,7 +147,7 @@ def populate_database(dataset):
     """Populate the database with sample dataset."""
     print("🔄 Populating database with sample data...")
     
-    conn = sqlite3.connect('user_data.db')
+    conn = connect('user_data.db')
     cursor = conn.cursor()
     
     try:
@@ -229,7 +229,7 @@ def export_dataset(dataset, filename="simple_dataset.json"):
 
 def generate_summary():
     """Generate summary of the dataset."""
-    conn = sqlite3.connect('user_data.db')
+    conn = connect('user_data.db')
     cursor = conn.cursor()
     
     try:
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Per-user conversation state storage for the English learning bot
+Holds each user's state machine position and session payload (the contents
+of context.user_data) with TTL expiry. The SQLite backend lets several bot
+processes share sessions and keeps them across restarts; the in-memory
+backend keeps the old single-process behaviour.
+"""
+
+import json
+import time
+import logging
+import threading
+from db_connection import get_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_TTL = 24 * 3600
+
+
+class MemoryStateStore:
+    """Process-local state store."""
+
+    def __init__(self, ttl_seconds=DEFAULT_SESSION_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._sessions = {}  # user_id -> [state, payload, expires_at]
+        self._lock = threading.Lock()
+
+    def _live(self, user_id):
+        session = self._sessions.get(user_id)
+        if session and session[2] < time.time():
+            del self._sessions[user_id]
+            return None
+        return session
+
+    def get_state(self, user_id):
+        """Return the user's state, or None if there is no live session."""
+        with self._lock:
+            session = self._live(user_id)
+            return session[0] if session else None
+
+    def set_state(self, user_id, state):
+        """Store the user's state and refresh the session expiry."""
+        with self._lock:
+            session = self._live(user_id)
+            if session is None:
+                session = self._sessions[user_id] = [None, {}, 0]
+            session[0] = state
+            session[2] = time.time() + self.ttl_seconds
+
+    def load_payload(self, user_id):
+        """Return a copy of the user's session payload ({} if none)."""
+        with self._lock:
+            session = self._live(user_id)
+            # Round-trip through JSON so callers never share mutable state
+            return json.loads(json.dumps(session[1])) if session else {}
+
+    def save_payload(self, user_id, payload):
+        """Store the user's session payload and refresh the session expiry."""
+        data = json.loads(json.dumps(payload, default=str))
+        with self._lock:
+            session = self._live(user_id)
+            if session is None:
+                session = self._sessions[user_id] = [None, {}, 0]
+            session[1] = data
+            session[2] = time.time() + self.ttl_seconds
+
+    def purge_expired(self):
+        """Drop expired sessions; returns how many were removed."""
+        now = time.time()
+        with self._lock:
+            expired = [user_id for user_id, session in self._sessions.items() if session[2] < now]
+            for user_id in expired:
+                del self._sessions[user_id]
+        return len(expired)
+
+    def close(self):
+        """Nothing to release."""
+
+
+class SQLiteStateStore:
+    """State store in a WAL-mode SQLite database, shareable between processes."""
+
+    def __init__(self, db_path="session_state.db", ttl_seconds=DEFAULT_SESSION_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.manager = get_manager(db_path, profile='small')
+        self.conn = self.manager.writer
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            user_id INTEGER PRIMARY KEY,
+            state INTEGER,
+            payload TEXT,
+            expires_at REAL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at
+        ON user_sessions (expires_at)
+        ''')
+        self.conn.commit()
+
+    def get_state(self, user_id):
+        """Return the user's state, or None if there is no live session."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT state FROM user_sessions WHERE user_id = ? AND expires_at >= ?",
+                (user_id, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, user_id, state):
+        """Store the user's state and refresh the session expiry."""
+        now = time.time()
+        with self._lock:
+            # An expired session starts over with an empty payload
+            self.conn.execute('''
+            INSERT INTO user_sessions (user_id, state, payload, expires_at) VALUES (?, ?, '{}', ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                state = excluded.state,
+                payload = CASE WHEN user_sessions.expires_at < ? THEN '{}' ELSE user_sessions.payload END,
+                expires_at = excluded.expires_at
+            ''', (user_id, state, now + self.ttl_seconds, now))
+            self.conn.commit()
+
+    def load_payload(self, user_id):
+        """Return the user's session payload ({} if none)."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT payload FROM user_sessions WHERE user_id = ? AND expires_at >= ?",
+                (user_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else {}
+
+    def save_payload(self, user_id, payload):
+        """Store the user's session payload and refresh the session expiry."""
+        now = time.time()
+        data = json.dumps(payload, default=str, ensure_ascii=False)
+        with self._lock:
+            self.conn.execute('''
+            INSERT INTO user_sessions (user_id, state, payload, expires_at) VALUES (?, NULL, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                state = CASE WHEN user_sessions.expires_at < ? THEN NULL ELSE user_sessions.state END,
+                payload = excluded.payload,
+                expires_at = excluded.expires_at
+            ''', (user_id, data, now + self.ttl_seconds, now))
+            self.conn.commit()
+
+    def purge_expired(self):
+        """Delete expired sessions; returns how many were removed."""
+        with self._lock:
+            cursor = self.conn.execute("DELETE FROM user_sessions WHERE expires_at < ?", (time.time(),))
+            self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        """Close the database connections."""
+        self.manager.close()
+
+
+def create_state_store(backend="sqlite", db_path="session_state.db", ttl_seconds=DEFAULT_SESSION_TTL):
+    """Build the configured state store backend ('sqlite' or 'memory')."""
+    if backend == "memory":
+        return MemoryStateStore(ttl_seconds=ttl_seconds)
+    if backend == "sqlite":
+        return SQLiteStateStore(db_path=db_path, ttl_seconds=ttl_seconds)
+    raise ValueError(f"Unknown state store backend: {backend}")
+
+
+class UserStates:
+    """dict-like view of per-user states backed by a state store."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, user_id, default=None):
+        state = self.store.get_state(user_id)
+        return default if state is None else state
+
+    def __getitem__(self, user_id):
+        state = self.store.get_state(user_id)
+        if state is None:
+            raise KeyError(user_id)
+        return state
+
+    def __setitem__(self, user_id, state):
+        self.store.set_state(user_id, state)
+
+    def __contains__(self, user_id):
+        return self.store.get_state(user_id) is not None
+
+
+class SessionSync:
+    """Load context.user_data from the store before an update and save it afterwards."""
+
+    def __init__(self, store):
+        self.store = store
+        self._loaded = {}  # user_id -> payload JSON as loaded, to skip unchanged saves
+
+    @staticmethod
+    def get_user_id(update):
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat else None
+
+    def load_user(self, user_id, user_data):
+        """Replace user_data with the stored session payload for user_id."""
+        payload = self.store.load_payload(user_id)
+        user_data.clear()
+        user_data.update(payload)
+        self._loaded[user_id] = json.dumps(payload, sort_keys=True, default=str)
+
+    def save_user(self, user_id, user_data):
+        """Write user_data back to the store if it changed since load_user."""
+        loaded = self._loaded.pop(user_id, None)
+        payload = dict(user_data)
+        if json.dumps(payload, sort_keys=True, default=str) == loaded:
+            return
+        try:
+            self.store.save_payload(user_id, payload)
+        except Exception as e:
+            logger.error(f"Error saving session for user {user_id}: {e}", exc_info=True)
+
+    async def load(self, update, context):
+        """Replace context.user_data with the stored session payload."""
+        user_id = self.get_user_id(update)
+        if user_id is None or context.user_data is None:
+            return
+        self.load_user(user_id, context.user_data)
+
+    async def save(self, update, context):
+        """Write context.user_data back to the store if it changed."""
+        user_id = self.get_user_id(update)
+        if user_id is None or context.user_data is None:
+            return
+        self.save_user(user_id, context.user_data)
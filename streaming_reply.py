@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Progressive Telegram replies for streamed LLM output
+Sends a placeholder message and edits it as text arrives, throttled to stay
+within Telegram's per-chat edit rate limits.
+"""
+
+import time
+import logging
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+
+class StreamingReply:
+    """A single bot message that is edited in place while text streams in."""
+
+    def __init__(self, message, prefix="", placeholder="⏳ در حال بررسی پاسخ شما...",
+                 edit_interval=1.2, min_new_chars=20):
+        """Prepare a streaming reply to `message`.
+
+        edit_interval is the minimum number of seconds between edits (Telegram
+        allows roughly one edit per second per chat) and min_new_chars skips
+        edits that would only add a few characters.
+        """
+        self.message = message
+        self.prefix = prefix
+        self.placeholder = placeholder
+        self.edit_interval = edit_interval
+        self.min_new_chars = min_new_chars
+        self.sent_message = None
+        self._last_edit = 0.0
+        self._last_text = ""
+
+    def _render(self, text):
+        """Prefix and trim text so it is always a valid message body."""
+        rendered = f"{self.prefix}{text}"
+        if len(rendered) > MAX_MESSAGE_LENGTH:
+            rendered = rendered[:MAX_MESSAGE_LENGTH - 1] + "…"
+        return rendered
+
+    async def start(self):
+        """Send the placeholder message if it has not been sent yet."""
+        if self.sent_message is None:
+            self._last_text = self._render(self.placeholder)
+            self.sent_message = await self.message.reply_text(self._last_text)
+            self._last_edit = time.monotonic()
+        return self.sent_message
+
+    async def _edit(self, text, reply_markup=None):
+        """Edit the placeholder, ignoring harmless Telegram edit errors."""
+        try:
+            await self.sent_message.edit_text(text, reply_markup=reply_markup)
+            self._last_text = text
+        except RetryAfter as e:
+            # Back off: the next throttled update will try again later
+            self._last_edit = time.monotonic() + float(e.retry_after)
+            return False
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                logger.warning(f"Could not edit streaming reply: {e}")
+                return False
+        self._last_edit = time.monotonic()
+        return True
+
+    async def update(self, text):
+        """Show partial text, skipping edits that come too fast or add too little."""
+        await self.start()
+        rendered = self._render(text)
+        if rendered == self._last_text:
+            return
+        if time.monotonic() - self._last_edit < self.edit_interval:
+            return
+        if len(rendered) - len(self._last_text) < self.min_new_chars:
+            return
+        await self._edit(rendered)
+
+    async def consume(self, chunks):
+        """Read an async iterator of text deltas and return the full text."""
+        await self.start()
+        text = ""
+        try:
+            async for delta in chunks:
+                text += delta
+                await self.update(text)
+        except Exception:
+            # Do not leave a dangling placeholder behind on failure
+            await self.discard()
+            raise
+        return text
+
+    async def finish(self, text, reply_markup=None):
+        """Replace the placeholder with the final text (and keyboard, if any)."""
+        if self.sent_message is None:
+            self.sent_message = await self.message.reply_text(text, reply_markup=reply_markup)
+            return self.sent_message
+        if len(text) > MAX_MESSAGE_LENGTH:
+            text = text[:MAX_MESSAGE_LENGTH - 1] + "…"
+        if not await self._edit(text, reply_markup=reply_markup):
+            # Edits are still being refused, fall back to a fresh message
+            self.sent_message = await self.message.reply_text(text, reply_markup=reply_markup)
+        return self.sent_message
+
+    async def discard(self):
+        """Delete the placeholder message, if one was sent."""
+        if self.sent_message is None:
+            return
+        try:
+            await self.sent_message.delete()
+        except TelegramError as e:
+            logger.warning(f"Could not delete streaming placeholder: {e}")
+        self.sent_message = None
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Concurrent update processing for the English learning bot
+Updates from different users run in parallel while updates from the same
+user are serialized, so per-user session state is never mutated concurrently.
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Update processor with a lock per user and a global concurrency cap."""
+
+    def __init__(self, max_concurrent_updates=64, max_pending_updates=None, max_pending_per_user=8):
+        """Create the processor.
+
+        max_concurrent_updates bounds how many handlers actually run at once.
+        max_pending_updates bounds how many updates may be in progress,
+        including those queued behind another update from the same user; it
+        defaults to four times the running limit. Queued updates hold one of
+        those slots, so max_pending_per_user caps how many a single user may
+        have in progress or queued; further updates from that user are
+        dropped until their queue drains. This keeps one user flooding
+        messages from taking every slot.
+        """
+        if max_pending_updates is None:
+            max_pending_updates = max_concurrent_updates * 4
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self.max_pending_per_user = max_pending_per_user
+        self.dropped_updates = 0
+        self._user_locks = {}
+        self._lock_users = {}
+
+    @staticmethod
+    def get_user_key(update):
+        """Return the id updates are serialized on, or None for anonymous updates."""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    @asynccontextmanager
+    async def user_lock(self, user_id):
+        """Hold the per-user lock; also usable by jobs that touch user state."""
+        if user_id is None:
+            yield
+            return
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        self._lock_users[user_id] = self._lock_users.get(user_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[user_id] -= 1
+            if self._lock_users[user_id] == 0:
+                # Nobody else is waiting on this user, drop the lock
+                del self._lock_users[user_id]
+                del self._user_locks[user_id]
+
+    async def do_process_update(self, update, coroutine):
+        """Await the handler coroutine under the user's lock."""
+        user_id = self.get_user_key(update)
+        if user_id is not None and self._lock_users.get(user_id, 0) >= self.max_pending_per_user:
+            self.dropped_updates += 1
+            logger.warning(f"Dropping update from user {user_id}: {self.max_pending_per_user} updates already pending")
+            if asyncio.iscoroutine(coroutine):
+                # Never awaited; close it so it is not reported as a leak
+                coroutine.close()
+            return
+        async with self.user_lock(user_id):
+            async with self._running:
+                await coroutine
+
+    async def initialize(self):
+        """Nothing to allocate up front."""
+
+    async def shutdown(self):
+        """Drop any remaining per-user locks."""
+        if self._user_locks:
+            logger.info(f"Shutting down update processor with {len(self._user_locks)} active user locks")
+        if self.dropped_updates:
+            logger.info(f"Update processor dropped {self.dropped_updates} updates from users over the pending limit")
+        self._user_locks.clear()
+        self._lock_users.clear()
@@ -2,110 +2,105 @@ import sqlite3
 import os
 from datetime import datetime
 import logging
+from write_buffer import WriteBuffer, BUFFERED_SECTIONS
+from word_bitmap import WordBitmap
+from db_connection import get_manager, chunked, executemany_chunked
+from db_migrations import migrate, USER_DB_MIGRATIONS
 
 logger = logging.getLogger(__name__)
 
+LEVELS = ['beginner', 'amateur', 'intermediate', 'advanced']
+
+class UserProfile:
+    """Snapshot of one user's row, loaded once per update.
+
+    Handlers read level and assessment status from here instead of querying
+    the database again; changes are written through to the database.
+    """
+    
+    def __init__(self, db, user_id, username=None, level='beginner', assessment_done=False,
+                 last_active=None, exists=False):
+        self.db = db
+        self.user_id = user_id
+        self.username = username
+        self.level = level
+        self.assessment_done = assessment_done
+        self.last_active = last_active
+        self.exists = exists
+        self._touched = False
+    
+    def touch(self):
+        """Record activity; writes at most once per profile snapshot."""
+        if not self._touched:
+            self.db.update_last_active(self.user_id)
+            self._touched = True
+    
+    def register(self, username):
+        """Make sure the user exists in the database. Returns True if newly added."""
+        is_new = self.db.register_user(self.user_id, username)
+        self.username = username
+        if is_new:
+            self.exists = True
+            self.level = 'beginner'
+            self.assessment_done = False
+            self._touched = True  # register_user sets last_active
+        return is_new
+    
+    def set_level(self, level):
+        """Change the user's level, creating the row if needed."""
+        success = self.db.update_user_level(self.user_id, level)
+        if not success or not self.exists:
+            success = self.db.force_update_level(self.user_id, level)
+        if success:
+            self.level = level
+            self.exists = True
+        return success
+    
+    def set_assessment_done(self, done=True):
+        """Mark whether the placement assessment has been completed."""
+        self.db.set_assessment_done(self.user_id, done)
+        self.assessment_done = done
+    
+    def check_and_upgrade_level(self):
+        """Upgrade the level if all sections are done; returns True if upgraded."""
+        upgraded = self.db.check_and_upgrade_level(self.user_id, current_level=self.level)
+        if upgraded and self.level in LEVELS[:-1]:
+            self.level = LEVELS[LEVELS.index(self.level) + 1]
+        return upgraded
+
 class UserDatabase:
     """Database for user management."""
     
-    def __init__(self, db_path="user_data.db"):
-        """Initialize database connection."""
-        # Create database directory if it doesn't exist
-        db_dir = os.path.dirname(db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-            
-        # Connect to database
-        self.conn = sqlite3.connect(db_path)
+    def __init__(self, db_path="user_data.db", write_buffer=None):
+        """Initialize database connection.
+
+        With a WriteBuffer, last_active updates and practice progress are
+        written behind in batches; call flush_writes() periodically and on
+        shutdown.
+        """
+        self.write_buffer = write_buffer
+        # Use the shared write connection for this database file
+        self.conn = get_manager(db_path).writer
         self.cursor = self.conn.cursor()
             
         # Initialize database
         self.init_database()
     
+    def read_view(self, conn):
+        """Return a UserReadView that runs queries on conn, e.g. a pooled
+        read-only connection owned by a worker thread.
+
+        The view shares this instance's write buffer, so pending writes are
+        still overlaid on reads.
+        """
+        return UserReadView(conn, self.write_buffer)
+
     def init_database(self):
-        """Initialize the database with required tables."""
+        """Bring the database schema up to date (a no-op when it is current)."""
         try:
-            # Create users table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                level TEXT DEFAULT 'beginner',
-                join_date TEXT,
-                last_active TEXT,
-                assessment_done BOOLEAN DEFAULT FALSE
-            )
-            ''')
-            
-            # Create progress table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                section TEXT,
-                level TEXT,
-                score REAL DEFAULT 0,
-                date TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-            
-            # Create vocabulary table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vocabulary (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                word TEXT,
-                score INTEGER DEFAULT 0,
-                last_practiced TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-            
-            # Create user_grammar table to track completed grammar lessons
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_grammar (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                level TEXT,
-                topic_id INTEGER,
-                score INTEGER DEFAULT 0,
-                completed_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-            
-            # Create user_conversation table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_conversation (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                topic_id INTEGER,
-                level TEXT,
-                seen_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-            
-            # Create index for faster lookups
-            self.cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_user_conversation_user_level 
-            ON user_conversation (user_id, level)
-            ''')
-            
-            # Create vocab_tested table to track tested words
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS vocab_tested (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                word TEXT,
-                tested_at TEXT,
-                FOREIGN KEY (user_id) REFERENCES users(user_id)
-            )
-            ''')
-            
-            self.conn.commit()
-            print("Database initialized successfully")
+            applied = migrate(self.conn, USER_DB_MIGRATIONS, "user_data.db")
+            if applied:
+                print(f"Database initialized successfully ({applied} migrations applied)")
         except Exception as e:
             print(f"Error initializing database: {e}")
     
@@ -142,10 +137,37 @@ class UserDatabase:
             return False
             
     
+    def get_profile(self, user_id):
+        """Load a UserProfile for a user with a single query."""
+        try:
+            self.cursor.execute(
+                "SELECT username, level, assessment_done, last_active FROM users WHERE user_id = ?",
+                (user_id,)
+            )
+            row = self.cursor.fetchone()
+        except Exception as e:
+            print(f"Error loading user profile: {e}")
+            row = None
+        if row is None:
+            return UserProfile(self, user_id)
+        pending_last_active = self.write_buffer.get_last_active(user_id) if self.write_buffer else None
+        return UserProfile(
+            self, user_id,
+            username=row[0],
+            level=row[1] or 'beginner',
+            assessment_done=row[2] == 1,
+            last_active=pending_last_active or row[3],
+            exists=True
+        )
+    
     def update_last_active(self, user_id):
         """Update the last active timestamp for a user."""
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if self.write_buffer:
+                self.write_buffer.touch(user_id, now)
+                self.maybe_flush_writes()
+                return
             self.cursor.execute(
                 "UPDATE users SET last_active = ? WHERE user_id = ?",
                 (now, user_id)
@@ -225,39 +247,74 @@ class UserDatabase:
     
     def get_user_progress(self, user_id):
         """Get progress for all sections and levels."""
-        progress = {}
-        for section in ['vocabulary', 'grammar', 'conversation', 'assessment']:
-            progress[section] = {}
-            for level in ['beginner', 'amateur', 'intermediate', 'advanced']:
-                progress[section][level] = self.get_section_progress(user_id, section, level)
+        progress = {
+            section: {level: 0 for level in LEVELS}
+            for section in ['vocabulary', 'grammar', 'conversation', 'assessment']
+        }
+        self.cursor.execute(
+            "SELECT section, level, score FROM progress_current WHERE user_id = ?",
+            (user_id,)
+        )
+        for section, level, score in self.cursor.fetchall():
+            if section in progress and level in progress[section]:
+                progress[section][level] = score
+        if self.write_buffer:
+            for (section, level), score in self.write_buffer.get_user_progress(user_id).items():
+                if section in progress and level in progress[section]:
+                    progress[section][level] = score
         return progress
 
-    def add_section_progress(self, user_id, section, level, increment):
+    def add_section_progress(self, user_id, section, level, increment, commit=True):
         """Increase progress for a section and level, capped at 100."""
         # Get current progress
         current = self.get_section_progress(user_id, section, level)
         new_score = min(100, current + increment)
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.write_buffer and section in BUFFERED_SECTIONS:
+            # Consecutive increments collapse into a single progress row
+            self.write_buffer.set_progress(user_id, section, level, new_score, now)
+            self.maybe_flush_writes()
+            return new_score
         self.cursor.execute(
             "INSERT INTO progress (user_id, section, level, score, date) VALUES (?, ?, ?, ?, ?)",
             (user_id, section, level, new_score, now)
         )
-        self.conn.commit()
+        if commit:
+            self.conn.commit()
         return new_score
 
+    def flush_writes(self):
+        """Write all buffered last_active and progress updates now."""
+        if not self.write_buffer:
+            return 0
+        rows = self.write_buffer.flush(self.conn)
+        if rows:
+            logger.debug(f"Flushed {rows} buffered user database writes")
+        return rows
+    
+    def maybe_flush_writes(self):
+        """Flush buffered writes if the buffer is full or due."""
+        if self.write_buffer and self.write_buffer.should_flush():
+            self.flush_writes()
+    
     def get_section_progress(self, user_id, section, level):
         """Get progress percent for a section and level."""
+        if self.write_buffer:
+            pending = self.write_buffer.get_progress(user_id, section, level)
+            if pending is not None:
+                return pending
         self.cursor.execute(
-            "SELECT score FROM progress WHERE user_id = ? AND section = ? AND level = ? ORDER BY date DESC LIMIT 1",
+            "SELECT score FROM progress_current WHERE user_id = ? AND section = ? AND level = ?",
             (user_id, section, level)
         )
         result = self.cursor.fetchone()
         return result[0] if result else 0
 
-    def check_and_upgrade_level(self, user_id):
+    def check_and_upgrade_level(self, user_id, current_level=None):
         """If all 3 sections for current level are >=80, upgrade user to next level and return True if upgraded."""
-        current_level = self.get_user_level(user_id)
-        levels = ['beginner', 'amateur', 'intermediate', 'advanced']
+        if current_level is None:
+            current_level = self.get_user_level(user_id)
+        levels = LEVELS
         
         # If user is already at advanced level, no upgrade possible
         if current_level == 'advanced':
@@ -284,8 +341,9 @@ class UserDatabase:
         
         # Check progress in all 3 sections for current level
         idx = levels.index(current_level)
+        progress = self.get_user_progress(user_id)
         for section in ['vocabulary', 'grammar', 'conversation']:
-            if self.get_section_progress(user_id, section, current_level) < 80:
+            if progress[section][current_level] < 80:
                 return False
         
         # All sections are >= 80%, upgrade to next level
@@ -307,6 +365,36 @@ class UserDatabase:
         
         return success
     
+    def get_notification_page(self, after_user_id=0, limit=1000):
+        """Get the next page of user IDs with notifications enabled, ordered by user_id.
+        
+        Keyset paging: pass the last user_id of the previous page as after_user_id.
+        """
+        try:
+            self.cursor.execute(
+                "SELECT user_id FROM users WHERE notifications = 1 AND user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit)
+            )
+            return [row[0] for row in self.cursor.fetchall()]
+        except Exception as e:
+            print(f"Error getting notification page: {e}")
+            return []
+    
+    def disable_notifications(self, user_ids):
+        """Turn off notifications for users who blocked the bot or deleted their chat."""
+        if not user_ids:
+            return 0
+        try:
+            self.cursor.executemany(
+                "UPDATE users SET notifications = 0 WHERE user_id = ?",
+                [(user_id,) for user_id in user_ids]
+            )
+            self.conn.commit()
+            return len(user_ids)
+        except Exception as e:
+            print(f"Error disabling notifications: {e}")
+            return 0
+    
     def get_users_with_notifications(self):
         """Get all users who have notifications enabled."""
         try:
@@ -318,7 +406,7 @@ class UserDatabase:
             print(f"Error getting users with notifications: {e}")
             return []
         
-    def save_assessment_result(self, user_id, percentage):
+    def save_assessment_result(self, user_id, percentage, commit=True):
         """Save assessment result and return success status."""
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -326,9 +414,13 @@ class UserDatabase:
                 "INSERT INTO progress (user_id, section, level, score, date) VALUES (?, ?, ?, ?, ?)",
                 (user_id, "assessment", self.get_user_level(user_id), percentage, now)
             )
-            self.conn.commit()
+            if commit:
+                self.conn.commit()
             return True, None
         except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
             error_msg = f"Error saving assessment result: {e}"
             print(error_msg)
             return False, error_msg
@@ -382,6 +474,8 @@ class UserDatabase:
     
     def debug_database(self, user_id):
         """Comprehensive database diagnostic."""
+        # Show what is really on disk
+        self.flush_writes()
         debug_info = {
             'db_exists': False,
             'db_size': 0,
@@ -475,30 +569,67 @@ class UserDatabase:
         
         return debug_info
 
+    def get_word_bitmap(self, user_id, kind):
+        """Get a user's 'studied' or 'tested' word set as a WordBitmap."""
+        try:
+            self.cursor.execute(
+                "SELECT bitmap FROM user_word_bitmaps WHERE user_id = ? AND kind = ?",
+                (user_id, kind)
+            )
+            row = self.cursor.fetchone()
+            return WordBitmap.from_bytes(row[0] if row else None)
+        except Exception as e:
+            print(f"Error getting {kind} word bitmap: {e}")
+            return WordBitmap()
+    
+    def add_to_word_bitmap(self, user_id, kind, word_ids, commit=True):
+        """Add word IDs to a user's 'studied' or 'tested' bitmap."""
+        word_ids = [word_id for word_id in word_ids if word_id is not None]
+        if not word_ids:
+            return
+        bitmap = self.get_word_bitmap(user_id, kind).with_ids(word_ids)
+        self.save_word_bitmap(user_id, kind, bitmap, commit=commit)
+    
+    def save_word_bitmap(self, user_id, kind, bitmap, commit=True):
+        """Store a user's bitmap together with its word count."""
+        self.cursor.execute('''
+            INSERT INTO user_word_bitmaps (user_id, kind, bitmap, word_count) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id, kind) DO UPDATE SET
+                bitmap = excluded.bitmap,
+                word_count = excluded.word_count
+        ''', (user_id, kind, bitmap.to_bytes(), len(bitmap)))
+        if commit:
+            self.conn.commit()
+    
     def get_words_studied_count(self, user_id):
         """Get the count of unique words studied by a user."""
         try:
             self.cursor.execute(
-                "SELECT COUNT(DISTINCT word) FROM vocabulary WHERE user_id = ?",
+                "SELECT word_count FROM user_word_bitmaps WHERE user_id = ? AND kind = 'studied'",
                 (user_id,)
             )
-            count = self.cursor.fetchone()[0]
-            return count
+            row = self.cursor.fetchone()
+            return row[0] if row else 0
         except Exception as e:
             print(f"Error getting words studied count: {e}")
             return 0
     
-    def add_word_studied(self, user_id, word, score):
+    def add_word_studied(self, user_id, word, score, word_id=None, commit=True):
         """Record that a user has studied a specific word."""
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             self.cursor.execute(
-                "INSERT INTO vocabulary (user_id, word, score, last_practiced) VALUES (?, ?, ?, ?)",
-                (user_id, word, score, now)
+                "INSERT INTO vocabulary (user_id, word, score, last_practiced, word_id) VALUES (?, ?, ?, ?, ?)",
+                (user_id, word, score, now, word_id)
             )
-            self.conn.commit()
+            self.add_to_word_bitmap(user_id, 'studied', [word_id], commit=False)
+            if commit:
+                self.conn.commit()
             return True
         except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
             print(f"Error adding word studied: {e}")
             # Check if vocabulary table exists, create if not
             try:
@@ -526,6 +657,62 @@ class UserDatabase:
                 print(f"Error creating vocabulary table: {create_e}")
             return False
 
+    def add_words_studied_bulk(self, rows, commit=True):
+        """Record many studied words at once; returns how many rows were inserted.
+
+        rows is an iterable of (user_id, word, score, word_id, last_practiced)
+        tuples, where word_id and last_practiced may be None (now is used for
+        the latter). Rows are inserted in chunks with executemany, and each
+        chunk updates every affected user's studied bitmap once.
+        """
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        inserted = 0
+        try:
+            for chunk in chunked(rows):
+                self.cursor.executemany(
+                    "INSERT INTO vocabulary (user_id, word, score, last_practiced, word_id) VALUES (?, ?, ?, ?, ?)",
+                    [(user_id, word, score, last_practiced or now, word_id)
+                     for user_id, word, score, word_id, last_practiced in chunk]
+                )
+                word_ids = {}
+                for user_id, _, _, word_id, _ in chunk:
+                    word_ids.setdefault(user_id, []).append(word_id)
+                for user_id, ids in word_ids.items():
+                    self.add_to_word_bitmap(user_id, 'studied', ids, commit=False)
+                if commit:
+                    self.conn.commit()
+                inserted += len(chunk)
+        except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
+            print(f"Error adding studied words in bulk: {e}")
+            if commit:
+                self.conn.rollback()
+        return inserted
+
+    def import_progress_rows(self, rows, commit=True):
+        """Insert progress history in bulk; returns how many rows were inserted.
+
+        rows is an iterable of (user_id, section, level, score, date) tuples.
+        The progress_current trigger keeps each user's latest scores in step.
+        """
+        try:
+            return executemany_chunked(
+                self.conn,
+                "INSERT INTO progress (user_id, section, level, score, date) VALUES (?, ?, ?, ?, ?)",
+                rows,
+                commit=commit
+            )
+        except Exception as e:
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
+            print(f"Error importing progress rows: {e}")
+            if commit:
+                self.conn.rollback()
+            return 0
+
     def get_recent_studied_words(self, user_id, limit=20):
         """Get recently studied words for testing."""
         try:
@@ -593,7 +780,7 @@ class UserDatabase:
     def add_grammar_seen(self, user_id, lesson_title, level):
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.cursor.execute(
-            "INSERT INTO user_grammar (user_id, lesson_title, level, date) VALUES (?, ?, ?, ?)",
+            "INSERT INTO user_grammar (user_id, lesson_title, level, completed_at) VALUES (?, ?, ?, ?)",
             (user_id, lesson_title, level, now)
         )
         self.conn.commit()
@@ -612,17 +799,17 @@ class UserDatabase:
         )
         self.conn.commit()
 
-    def add_conversation_seen(self, user_id, topic, level):
+    def add_conversation_seen(self, user_id, topic_id, level):
         now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.cursor.execute(
-            "INSERT INTO user_conversation (user_id, topic, level, date) VALUES (?, ?, ?, ?)",
-            (user_id, topic, level, now)
+            "INSERT INTO user_conversation (user_id, topic_id, level, seen_at) VALUES (?, ?, ?, ?)",
+            (user_id, topic_id, level, now)
         )
         self.conn.commit()
 
     def get_seen_conversation_topics(self, user_id, level):
         self.cursor.execute(
-            "SELECT topic FROM user_conversation WHERE user_id = ? AND level = ?",
+            "SELECT topic_id FROM user_conversation WHERE user_id = ? AND level = ?",
             (user_id, level)
         )
         return set(row[0] for row in self.cursor.fetchall())
@@ -662,32 +849,43 @@ class UserDatabase:
             print(f"Error getting average vocabulary score: {e}")
             return 0
 
-    def get_next_untested_words(self, user_id, level, batch_size=20):
-        """Get the next batch of untested words for a user and level."""
-        try:
-            self.cursor.execute('''
-                SELECT w.word, w.definition
-                FROM vocabulary_words w
-                LEFT JOIN vocab_tested t ON w.word = t.word AND t.user_id = ?
-                WHERE w.level = ?
-                AND w.word IN (SELECT word FROM vocabulary WHERE user_id = ?)
-                AND t.word IS NULL
-                LIMIT ?
-            ''', (user_id, level, user_id, batch_size))
-            return [{'word': row[0], 'definition': row[1]} for row in self.cursor.fetchall()]
-        except Exception as e:
-            print(f"Error getting untested words: {e}")
-            return []
-
-    def mark_words_tested(self, user_id, words):
+    def mark_words_tested(self, user_id, words, word_ids=None, commit=True):
         """Mark a list of words as tested for a user."""
         try:
             now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for word in words:
-                self.cursor.execute(
-                    "INSERT INTO vocab_tested (user_id, word, tested_at) VALUES (?, ?, ?)",
-                    (user_id, word, now)
-                )
-            self.conn.commit()
+            word_ids = word_ids or [None] * len(words)
+            self.cursor.executemany(
+                "INSERT INTO vocab_tested (user_id, word, tested_at, word_id) VALUES (?, ?, ?, ?)",
+                [(user_id, word, now, word_id) for word, word_id in zip(words, word_ids)]
+            )
+            self.add_to_word_bitmap(user_id, 'tested', word_ids, commit=False)
+            if commit:
+                self.conn.commit()
         except Exception as e:
-            print(f"Error marking words as tested: {e}")
\ No newline at end of file
+            if not commit:
+                # The caller owns the transaction and rolls this write back
+                raise
+            print(f"Error marking words as tested: {e}")
+
+
+class UserReadView:
+    """Read-only user queries for worker threads (see UserDatabase.read_view).
+
+    Not a UserDatabase: only the read methods listed below are shared, so no
+    write can be attempted on the read-only connection.
+    """
+
+    def __init__(self, conn, write_buffer=None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.write_buffer = write_buffer
+
+    # These only use self.cursor and self.write_buffer
+    get_profile = UserDatabase.get_profile
+    get_user_level = UserDatabase.get_user_level
+    get_user_progress = UserDatabase.get_user_progress
+    get_section_progress = UserDatabase.get_section_progress
+    get_words_studied_count = UserDatabase.get_words_studied_count
+    get_word_bitmap = UserDatabase.get_word_bitmap
+    get_latest_assessment_result = UserDatabase.get_latest_assessment_result
+    has_recent_assessment = UserDatabase.has_recent_assessment
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Webhook serving mode for the English learning bot
+Runs a tornado HTTP server next to the python-telegram-bot Application:
+Telegram posts updates to the webhook route, which checks the secret token
+and queues them, and a health route reports bot status for load balancers.
+"""
+
+import json
+import hmac
+import time
+import signal
+import asyncio
+import logging
+from tornado.web import Application as WebApplication, RequestHandler
+from tornado.httpserver import HTTPServer
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# bot.py does not feed handler, OpenAI or database calls into bot_analytics,
+# so the health score only reflects host metrics (CPU, memory, disk)
+HEALTH_SCOPE = "host metrics only"
+
+
+class TelegramWebhookHandler(RequestHandler):
+    """Receive updates from Telegram and put them on the application's update queue."""
+
+    def initialize(self, bot_application, secret_token):
+        # tornado reserves self.application for its own web application
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token:
+            received = self.request.headers.get(SECRET_TOKEN_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                logger.warning(f"Rejected webhook request from {self.request.remote_ip}: bad secret token")
+                self.set_status(403)
+                return
+        try:
+            data = json.loads(self.request.body)
+            update = Update.de_json(data, self.bot_application.bot)
+        except Exception as e:
+            logger.error(f"Invalid webhook payload: {e}")
+            self.set_status(400)
+            return
+        # Reply at once; updates are processed by the application's workers
+        await self.bot_application.update_queue.put(update)
+        self.set_status(200)
+
+
+class HealthReporter:
+    """Analytics health status for the health route, computed off the event loop.
+
+    bot_integration (psutil and a monitor thread) is imported once by load()
+    when webhook mode starts. Each report runs in a worker thread and is
+    reused for cache_seconds, so frequent probes cost nothing.
+    """
+
+    def __init__(self, cache_seconds=5.0):
+        self.cache_seconds = cache_seconds
+        self._get_health_status = None
+        self._unavailable = "analytics not loaded"
+        self._cached = None
+        self._cached_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def load(self):
+        """Import the analytics integration; failures leave probes answering without it."""
+        try:
+            from bot_integration import get_health_status
+            self._get_health_status = get_health_status
+        except Exception as e:
+            # Analytics dependencies are optional, still answer the probe
+            self._unavailable = f"analytics unavailable: {e}"
+            logger.warning(f"Health route will not report analytics: {e}")
+
+    async def status(self):
+        """Return the (possibly cached) health dict."""
+        if self._get_health_status is None:
+            return {'status': 'HEALTHY', 'note': self._unavailable}
+        async with self._lock:
+            if self._cached is None or time.monotonic() - self._cached_at >= self.cache_seconds:
+                loop = asyncio.get_running_loop()
+                try:
+                    health = await loop.run_in_executor(None, self._get_health_status)
+                except Exception as e:
+                    health = {'status': 'ERROR', 'error': str(e)}
+                health['scope'] = HEALTH_SCOPE
+                self._cached = health
+                self._cached_at = time.monotonic()
+            return dict(self._cached)
+
+
+class HealthHandler(RequestHandler):
+    """Report bot health as JSON; 503 when the bot is in a critical state."""
+
+    def initialize(self, reporter, extra_status=None):
+        self.reporter = reporter
+        self.extra_status = extra_status
+
+    async def get(self):
+        health = await self.reporter.status()
+        if self.extra_status:
+            health.update(self.extra_status())
+        self.set_status(503 if health.get('status') in ('CRITICAL', 'ERROR') else 200)
+        self.set_header("Content-Type", "application/json")
+        self.finish(json.dumps(health, default=str))
+
+
+async def run_webhook(application, webhook_url, url_path="telegram", listen="0.0.0.0", port=8443,
+                      secret_token=None, max_connections=40, health_path="health",
+                      extra_status=None, drop_pending_updates=False, health_cache_seconds=5.0):
+    """Register the webhook with Telegram and serve updates until SIGINT/SIGTERM.
+
+    max_connections is the number of simultaneous HTTPS connections Telegram
+    may open to deliver updates (1-100). extra_status is an optional callable
+    whose dict is merged into the health response, which is otherwise cached
+    for health_cache_seconds.
+    """
+    reporter = HealthReporter(cache_seconds=health_cache_seconds)
+    await asyncio.get_running_loop().run_in_executor(None, reporter.load)
+    web_app = WebApplication([
+        (rf"/{url_path.strip('/')}", TelegramWebhookHandler,
+         {'bot_application': application, 'secret_token': secret_token}),
+        (rf"/{health_path.strip('/')}", HealthHandler, {'reporter': reporter, 'extra_status': extra_status}),
+    ])
+    server = HTTPServer(web_app, xheaders=True)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Signal handlers are not available on Windows event loops
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=secret_token,
+            max_connections=max_connections,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=drop_pending_updates
+        )
+        await application.start()
+        server.listen(port, address=listen)
+        logger.info(f"Webhook server listening on {listen}:{port}, Telegram posts to {webhook_url}")
+        await stop_event.wait()
+    finally:
+        logger.info("Stopping webhook server...")
+        server.stop()
+        await server.close_all_connections()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Compact sets of vocabulary word IDs
+A user's studied and tested words are kept as bitmaps over vocabulary_words
+IDs: bit n is set when word n is in the set. Stored as little-endian bytes,
+a user who has seen every word in a 1,000-word vocabulary takes 125 bytes,
+and membership, counts and set differences are integer bit operations.
+"""
+
+
+class WordBitmap:
+    """Immutable set of non-negative word IDs backed by a Python int."""
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    @classmethod
+    def from_ids(cls, word_ids):
+        bits = 0
+        for word_id in word_ids:
+            bits |= 1 << word_id
+        return cls(bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(int.from_bytes(data or b'', 'little'))
+
+    def to_bytes(self):
+        return self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')
+
+    def with_ids(self, word_ids):
+        """Return a new bitmap that also contains word_ids."""
+        return self | WordBitmap.from_ids(word_ids)
+
+    def ids(self):
+        """Yield the word IDs in ascending order."""
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __contains__(self, word_id):
+        return word_id is not None and word_id >= 0 and (self.bits >> word_id) & 1 == 1
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __or__(self, other):
+        return WordBitmap(self.bits | other.bits)
+
+    def __and__(self, other):
+        return WordBitmap(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return WordBitmap(self.bits & ~other.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, WordBitmap) and self.bits == other.bits
+
+    def __repr__(self):
+        return f"WordBitmap({len(self)} words)"
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Write-behind buffer for high-frequency user database writes
+Coalesces last_active updates and practice progress increments per user in
+memory and writes them in one batched transaction, instead of an UPDATE or
+INSERT plus commit (and fsync) for every message.
+"""
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Progress for these sections is written behind; assessment results stay
+# synchronous because level checks query them with SQL directly.
+BUFFERED_SECTIONS = ('vocabulary', 'grammar', 'conversation')
+
+
+class WriteBuffer:
+    """Pending last_active timestamps and progress scores, keyed per user."""
+
+    def __init__(self, flush_interval=5.0, max_pending=500):
+        """flush_interval is the longest a write may wait in seconds;
+        max_pending is how many pending rows trigger an early flush."""
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.last_active = {}  # user_id -> timestamp string
+        self.progress = {}     # (user_id, section, level) -> (score, date)
+        self.last_flush = time.monotonic()
+        self.flushed_rows = 0
+        self.coalesced_writes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def touch(self, user_id, timestamp):
+        """Queue a last_active update, replacing any pending one for the user."""
+        with self._lock:
+            if user_id in self.last_active:
+                self.coalesced_writes += 1
+            self.last_active[user_id] = timestamp
+
+    def set_progress(self, user_id, section, level, score, date):
+        """Queue the new progress score for a section, replacing any pending one."""
+        with self._lock:
+            key = (user_id, section, level)
+            if key in self.progress:
+                self.coalesced_writes += 1
+            self.progress[key] = (score, date)
+
+    def get_progress(self, user_id, section, level):
+        """Return the pending score for a section, or None if nothing is pending."""
+        with self._lock:
+            pending = self.progress.get((user_id, section, level))
+        return pending[0] if pending else None
+
+    def get_user_progress(self, user_id):
+        """Return {(section, level): score} for the user's pending progress writes."""
+        with self._lock:
+            return {
+                (section, level): score
+                for (pending_user, section, level), (score, _) in self.progress.items()
+                if pending_user == user_id
+            }
+
+    def get_last_active(self, user_id):
+        """Return the pending last_active timestamp, or None."""
+        with self._lock:
+            return self.last_active.get(user_id)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self.last_active) + len(self.progress)
+
+    def should_flush(self):
+        """True when the buffer is full or the oldest write has waited long enough."""
+        if self.pending_count() >= self.max_pending:
+            return True
+        return time.monotonic() - self.last_flush >= self.flush_interval
+
+    def flush(self, conn):
+        """Write everything pending in a single transaction; returns rows written.
+
+        Entries stay in the buffer until the commit succeeds, so readers on
+        other connections see either the buffered or the committed value,
+        never a stale one. Only entries not replaced meanwhile are dropped.
+        """
+        with self._flush_lock:
+            with self._lock:
+                last_active = dict(self.last_active)
+                progress = dict(self.progress)
+                self.last_flush = time.monotonic()
+            if not last_active and not progress:
+                return 0
+            try:
+                with conn:
+                    conn.executemany(
+                        "UPDATE users SET last_active = ? WHERE user_id = ?",
+                        [(timestamp, user_id) for user_id, timestamp in last_active.items()]
+                    )
+                    conn.executemany(
+                        "INSERT INTO progress (user_id, section, level, score, date) VALUES (?, ?, ?, ?, ?)",
+                        [(user_id, section, level, score, date)
+                         for (user_id, section, level), (score, date) in progress.items()]
+                    )
+            except Exception as e:
+                logger.error(f"Error flushing buffered writes, will retry: {e}")
+                return 0
+            with self._lock:
+                for user_id, timestamp in last_active.items():
+                    if self.last_active.get(user_id) == timestamp:
+                        del self.last_active[user_id]
+                for key, value in progress.items():
+                    if self.progress.get(key) == value:
+                        del self.progress[key]
+            rows = len(last_active) + len(progress)
+            self.flushed_rows += rows
+            return rows
+
+    def stats(self):
+        """Return buffer counters for monitoring."""
+        return {
+            'pending': self.pending_count(),
+            'flushed_rows': self.flushed_rows,
+            'coalesced_writes': self.coalesced_writes
+        }